@@ -0,0 +1,80 @@
+"""
+Intent router benchmark: routing accuracy and latency of the local intent router on a labeled utterance set
+that is not part of its training examples.
+
+    python -m benchmarks.intent_router [--min-similarity 0.3] [--min-margin 0.1] [--show-errors]
+
+An utterance is either routed locally (the router is confident) or left to the primary assistant's LLM.
+- coverage: share of the utterances routed locally, i.e. LLM round trips saved
+- precision: share of the locally routed utterances sent to the right assistant
+- misroutes: utterances routed locally to the wrong assistant (the specialist escalates them back)
+- recall per assistant: share of its utterances routed locally to it
+Latency is the classification time per utterance, after the router is fitted.
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+import numpy as np
+from graph.intent_router import IntentRouter, HANDOFFS
+from tools import INTENT_EXAMPLES, INTENT_MIN_SIMILARITY, INTENT_MIN_MARGIN
+
+UTTERANCES = os.path.join(os.path.dirname(__file__), "intent_utterances.json")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--examples", default=INTENT_EXAMPLES, help="training examples of the router")
+    parser.add_argument("--utterances", default=UTTERANCES, help="labeled evaluation utterances")
+    parser.add_argument("--min-similarity", type=float, default=INTENT_MIN_SIMILARITY)
+    parser.add_argument("--min-margin", type=float, default=INTENT_MIN_MARGIN)
+    parser.add_argument("--repeat", type=int, default=20, help="classifications per utterance for the latency")
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    with open(args.examples, encoding="utf8") as f:
+        router = IntentRouter(json.load(f), args.min_similarity, args.min_margin)
+    fit_ms = (time.perf_counter() - start) * 1000
+    with open(args.utterances, encoding="utf8") as f:
+        utterances = json.load(f)
+
+    routed = correct = 0
+    recall = Counter()
+    totals = Counter(utterance["assistant"] for utterance in utterances)
+    errors = []
+    latencies = []
+    for utterance in utterances:
+        for _ in range(args.repeat):
+            t = time.perf_counter()
+            intent = router.classify(utterance["text"])
+            latencies.append((time.perf_counter() - t) * 1e6)
+        if intent.confident:
+            routed += 1
+            if intent.assistant == utterance["assistant"]:
+                correct += 1
+                recall[utterance["assistant"]] += 1
+            else:
+                errors.append(("misroute", utterance, intent))
+        elif args.show_errors and utterance["assistant"] != "primary_assistant":
+            errors.append(("to LLM", utterance, intent))
+
+    print(f"router fitted on {len(router.examples)} examples in {fit_ms:.1f} ms, "
+          f"min similarity {args.min_similarity}, min margin {args.min_margin}")
+    print(f"utterances: {len(utterances)}")
+    print(f"coverage:   {routed / len(utterances):.1%} routed locally ({routed}), the rest goes to the LLM")
+    print(f"precision:  {correct / routed if routed else 0.0:.1%} ({routed - correct} misroutes)")
+    for assistant, total in sorted(totals.items()):
+        if assistant in HANDOFFS:
+            print(f"  recall {assistant:<20} {recall[assistant] / total:.1%} of {total}")
+        else:
+            print(f"  {assistant:<27} {total} utterances, always left to the LLM")
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"latency:    p50 {p50:.0f} us, p95 {p95:.0f} us, p99 {p99:.0f} us per classification")
+    if args.show_errors:
+        for kind, utterance, intent in errors:
+            print(f"  {kind:<8} {utterance['text']!r} ({utterance['assistant']}) -> {intent.assistant} "
+                  f"similarity {intent.similarity:.2f} margin {intent.margin:.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Startup benchmark: import time of the agents and tools, and latency of the first request of each kind,
+measured in fresh processes so that every run is a cold start.
+
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --runs 5 --warm-up   # run tools.resources.warm_up() before the first requests
+
+Market data is served by the offline fixture provider and FAQ embeddings by the local backend,
+unless MARKET_DATA_PROVIDER / FAQ_EMBEDDING_BACKEND are set.
+A request failing in the sandbox (e.g. OpenAI embeddings without an API key) is reported instead of timed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Runs in the child process, prints one JSON line of timings in seconds
+CHILD = r"""
+import json, sys, time
+timings = {}
+start = time.perf_counter()
+import graph.assistant
+timings["import graph.assistant"] = time.perf_counter() - start
+
+if "--warm-up" in sys.argv:
+    from tools.resources import warm_up
+    start = time.perf_counter()
+    warm_up()
+    timings["warm_up()"] = time.perf_counter() - start
+
+from tools.account_assistant_tools import check_saving_account_balance, check_account_history
+from tools.trading_assistant_tools import search_stock, check_earnings
+from tools.DB_usage_assistant_tools import lookup_digital_banking_faq
+requests = {
+    "first check_saving_account_balance": (check_saving_account_balance, {"user_id": "AB123"}),
+    "first check_account_history": (check_account_history, {"user_id": "AB123", "start_date": "2000-01-01", "end_date": "2100-01-01"}),
+    "first check_earnings": (check_earnings, {"user_id": "AB123"}),
+    "first search_stock": (search_stock, {"stock": "Apple"}),
+    "first lookup_digital_banking_faq": (lookup_digital_banking_faq, {"query": "What is the trading fee?"}),
+}
+for name, (tool, args) in requests.items():
+    start = time.perf_counter()
+    try:
+        tool.invoke(args)
+        timings[name] = time.perf_counter() - start
+    except Exception as e:
+        timings[name] = f"{type(e).__name__}: {e}"[:120]
+print(json.dumps(timings))
+"""
+
+def run_once(warm_up: bool) -> dict:
+    """Run the child script in a fresh interpreter and return its timings."""
+    env = {**os.environ, "PYTHONPATH": str(PROJECT_ROOT)}
+    env.setdefault("MARKET_DATA_PROVIDER", "fixture")
+    env.setdefault("FAQ_EMBEDDING_BACKEND", "local")
+    env.setdefault("OPENAI_API_KEY", "offline")
+    env.setdefault("TAVILY_API_KEY", "offline")
+    args = [sys.executable, "-c", CHILD] + (["--warm-up"] if warm_up else [])
+    output = subprocess.run(args, cwd=PROJECT_ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="number of cold starts")
+    parser.add_argument("--warm-up", action="store_true", help="call warm_up() right after the imports")
+    args = parser.parse_args()
+
+    # Make sure the database is bootstrapped, so the runs don't time a rebuild from Excel
+    from tools import banking_data_excel, banking_data_db
+    from tools.init_db import create_db_update_date
+    create_db_update_date(banking_data_excel, banking_data_db)
+
+    runs = [run_once(args.warm_up) for _ in range(args.runs)]
+    print(f"{'phase':<40} {'median ms':>10} {'max ms':>10}")
+    for phase in runs[0]:
+        values = [run[phase] for run in runs]
+        numbers = [v for v in values if isinstance(v, float)]
+        if len(numbers) < len(values):
+            print(f"{phase:<40} {'failed':>10}  {next(v for v in values if not isinstance(v, float))}")
+        else:
+            print(f"{phase:<40} {statistics.median(numbers) * 1000:>10.1f} {max(numbers) * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main()
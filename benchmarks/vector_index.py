@@ -0,0 +1,81 @@
+"""
+Vector index benchmark: recall@k and latency of the FAQ vector search layouts on a synthetic clustered corpus,
+against the original brute-force scan (float64, one query at a time).
+
+    python -m benchmarks.vector_index --rows 50000 --dim 1536 --queries 200
+
+Recall is measured against the exact float64 top k.
+The synthetic vectors spread their information over all dimensions, so the recall of the truncated layout is a lower bound:
+truncation is meant for models trained for it, e.g. OpenAI text-embedding-3.
+"""
+import argparse
+import time
+import numpy as np
+from tools.vector_index import prepare_vectors, FlatIndex, IVFIndex
+
+def brute_force(matrix: np.ndarray, query: np.ndarray, k: int) -> np.ndarray:
+    """The original VectorStoreRetriever.query scan."""
+    scores = np.array(query) @ matrix.T
+    top_k_idx = np.argpartition(scores, -k)[-k:]
+    return top_k_idx[np.argsort(-scores[top_k_idx])]
+
+def make_corpus(rows: int, dim: int, n_queries: int, clusters: int, seed: int = 0):
+    """Embedding-like data: normalized points around random topic centers, queries drawn the same way."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    def sample(n):
+        points = centers[rng.integers(clusters, size=n)] + rng.normal(scale=3.0, size=(n, dim))
+        return points / np.linalg.norm(points, axis=1, keepdims=True)
+    return sample(rows), sample(n_queries)
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=200, help="topics of the synthetic corpus")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--truncate", type=int, default=256, help="also test the first N dimensions only, 0 to skip")
+    args = parser.parse_args()
+    k = args.k
+
+    matrix, queries = make_corpus(args.rows, args.dim, args.queries, args.clusters)
+    exact = np.array([brute_force(matrix, q, k) for q in queries])
+    print(f"{args.rows} rows x {args.dim} dims, {args.queries} queries, k={k}")
+    print(f"{'layout':<36} {'build s':>8} {'ms/query':>9} {'recall@k':>9}")
+
+    def report(name, build_seconds, search):
+        start = time.perf_counter()
+        found = search()
+        per_query = (time.perf_counter() - start) * 1000 / len(queries)
+        print(f"{name:<36} {build_seconds:>8.2f} {per_query:>9.3f} {recall(found, exact):>9.3f}")
+
+    report("brute force float64, per query", 0.0, lambda: [brute_force(matrix, q, k) for q in queries])
+
+    start = time.perf_counter()
+    matrix32 = prepare_vectors(matrix)
+    flat = FlatIndex(matrix32)
+    build = time.perf_counter() - start
+    queries32 = prepare_vectors(queries)
+    report("flat float32, per query", build, lambda: [flat.search(q[None, :], k)[1][0] for q in queries32])
+    report("flat float32, query_many batch", build, lambda: flat.search(queries32, k)[1])
+
+    if args.truncate and args.truncate < args.dim:
+        start = time.perf_counter()
+        truncated = FlatIndex(prepare_vectors(matrix, args.truncate))
+        build = time.perf_counter() - start
+        queries_truncated = prepare_vectors(queries, args.truncate)
+        report(f"flat float32 first {args.truncate} dims, batch", build, lambda: truncated.search(queries_truncated, k)[1])
+
+    start = time.perf_counter()
+    ivf = IVFIndex(matrix32)
+    build = time.perf_counter() - start
+    for n_probe in (4, 8, 16, 32):
+        ivf.n_probe = n_probe
+        report(f"ivf {len(ivf.centroids)} lists, {n_probe} probes, batch", build, lambda: ivf.search(queries32, k)[1])
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import asyncio
+import threading
+import time
 from datetime import datetime
+from langchain_core.messages import AIMessage
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from graph.context_window import ContextWindow
+from graph.retry_policy import RetryPolicy
 from graph.base_data_model import ToTradingAssistant, ToAccountAssistant, ToDBUsageAssistant, CompleteOrEscalate
 from graph.llm import llm
 from graph.state import State
@@ -19,7 +25,7 @@ primary_assistant_prompt = ChatPromptTemplate.from_messages(
             "Current time: {time}."
             "\nYou are the primary assistant of customer service for the bank."
             "You primary responsibility is to answer the user's basic queries, like check basic information, e.g. the information of their relationship manager (RM) and appointments with the RM."
-            "All the information about the user is here: \n<User>\n{user_info}\n<User>\n"
+            "All the information about the user is here: \n<User>\n{user_info_prompt}\n<User>\n"
             "Try to greet the client with their given name at the beginning of the conversation."
             "\nIf the user wants to know the existing appointments with the relationship manager, call the tool of 'contact_rm', only pass user_id to it, do not pass any other parameters. "
             "You will be returned to the information of existing appointments."
@@ -188,14 +194,57 @@ DB_usage_assistant_runnable = DB_usage_assistant_prompt | llm.bind_tools(
     DB_usage_assistant_tools + [CompleteOrEscalate]
 )
 
+# Assistants by name, for assistant_stats()
+_assistants = {}
+
+# Reply of an assistant whose model kept returning empty responses
+FALLBACK_REPLY = ("Sorry, I could not process your request this time. "
+                  "Please rephrase it or try again in a moment.")
+
 class BankingAssistant:
     # Define a class as the Primary Assistant node in the graph
-    def __init__(self, runnable : Runnable):
+    def __init__(self, runnable : Runnable, name: str = "assistant", context: ContextWindow = None,
+                 retry: RetryPolicy = None):
         """
         Initialize the class instance
         :param runnable: runnable object that is a chain of the prompt and the model with tools
+        :param name: name of the assistant, used in its counters
+        :param context: context window fitting the conversation into the token budget, the default one if None
+        :param retry: retry policy for empty model responses, the default one if None
         """
         self.runnable = runnable
+        self.name = name
+        self.context = context or ContextWindow()
+        self.retry = retry or RetryPolicy()
+        self.prompt = getattr(runnable, "first", None)  # the prompt template, counted in the budget
+        self._lock = threading.Lock()
+        # node runs, empty responses retried, and node runs answered with the fallback reply
+        self.stats = {"calls": 0, "empty_retries": 0, "fallbacks": 0}
+        _assistants[name] = self
+
+    def _count(self, counter: str):
+        with self._lock:
+            self.stats[counter] += 1
+
+    def _after_invalid(self, state: dict, attempt: int, started: float) -> tuple[dict, float | None]:
+        # ask the model again for a valid input, or give up when the retry policy is exhausted
+        delay = self.retry.next_delay(attempt, started)
+        if delay is None:
+            self._count("fallbacks")
+            return state, None
+        self._count("empty_retries")
+        messages = state["messages"] + [("user", "Please provide a valid input.")]
+        return {**state, "messages": messages}, delay
+
+    @staticmethod
+    def _is_valid(result) -> bool:
+        # if the result has no tool calls and [the content is empty or the first element of the content list has no 'text'], user need to re-input.
+        return bool(result.tool_calls) or not (
+            not result.content
+            or isinstance(result.content, list)
+            and not result.content[0].get("text")
+        )
+
     def __call__(self, state: State, config: RunnableConfig) -> str:
         """
         Run the Primary Assistant node
@@ -203,21 +252,62 @@ class BankingAssistant:
         :param config: includes user id
         :return: output of the Primary Assistant node
         """
+        # recent turns within the token budget, older ones folded into the summary
+        state, update = self.context.prepare(state, self.prompt)
+        self._count("calls")
+        started = time.monotonic()
+        attempt = 1
         while True:
-            # create an infinite loop, execute it till the result from self.runnable is valid
-            # if the result is invalid (e.g. no tool calls and content is empty or content doesn't meet the requirements), keep the loop going
+            # execute self.runnable till the result is valid, at most retry.max_attempts times within retry.deadline
+            # if the result is invalid (e.g. no tool calls and content is empty or content doesn't meet the requirements), try again after a backoff
             result = self.runnable.invoke(state)
 
             # if runnable is executed, but no valid result
-            if not result.tool_calls and (#if the result has no tool calls and [the content is empty or the first element of the content list has no 'text'], user need to re-input.
-                not result.content
-                or isinstance(result.content, list)
-                and not result.content[0].get("text")
-            ):
-                messages = state["messages"] + [("user", "Please provide a valid input.")]
-                state = {**state, "messages": messages}
+            if not self._is_valid(result):
+                state, delay = self._after_invalid(state, attempt, started)
+                if delay is None:
+                    result = AIMessage(content=FALLBACK_REPLY)
+                    break
+                time.sleep(delay)
+                attempt += 1
 
             else:
                 break
 
-        return {"messages": result}
\ No newline at end of file
+        return {"messages": result, **update}
+
+    async def acall(self, state: State, config: RunnableConfig) -> str:
+        """
+        Run the node asynchronously, the event loop serves other conversations while waiting for the LLM
+        :param state: includes current workflow's tasks
+        :param config: includes user id
+        :return: output of the node
+        """
+        state, update = await self.context.aprepare(state, self.prompt)
+        self._count("calls")
+        started = time.monotonic()
+        attempt = 1
+        while True:
+            result = await self.runnable.ainvoke(state)
+            if not self._is_valid(result):
+                state, delay = self._after_invalid(state, attempt, started)
+                if delay is None:
+                    result = AIMessage(content=FALLBACK_REPLY)
+                    break
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                break
+
+        return {"messages": result, **update}
+
+    def as_node(self) -> Runnable:
+        """
+        Wrap the assistant as a graph node with a sync and a native async implementation,
+        graph.stream() calls __call__ and graph.astream() calls acall.
+        """
+        return RunnableLambda(self, afunc=self.acall)
+
+def assistant_stats() -> dict:
+    """Return the counters of every assistant by name."""
+    return {name: dict(assistant.stats) for name, assistant in _assistants.items()}
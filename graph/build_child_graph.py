@@ -17,7 +17,7 @@ def build_trading_graph(builder: StateGraph) -> StateGraph:
         "enter_trading_assistant",
         create_entry_node("Trading Assistant", "trading_assistant")
     )
-    builder.add_node("trading_assistant", BankingAssistant(trading_assistant_runnable))
+    builder.add_node("trading_assistant", BankingAssistant(trading_assistant_runnable, "trading_assistant").as_node())
     builder.add_edge("enter_trading_assistant", "trading_assistant")
 
     # Add nodes for sensitive tools and safe tools
@@ -107,7 +107,7 @@ def build_account_graph(builder: StateGraph) -> StateGraph:
         "enter_account_assistant",
         create_entry_node("Account Assistant", "account_assistant")
     )
-    builder.add_node("account_assistant", BankingAssistant(account_assistant_runnable))
+    builder.add_node("account_assistant", BankingAssistant(account_assistant_runnable, "account_assistant").as_node())
     builder.add_edge("enter_account_assistant", "account_assistant")
 
     # Add nodes for sensitive tools and safe tools
@@ -172,7 +172,7 @@ def build_DB_usage_graph(builder: StateGraph) -> StateGraph:
         "enter_DB_usage_assistant",
         create_entry_node("DB Usage Assistant", "DB_usage_assistant")
     )
-    builder.add_node("DB_usage_assistant", BankingAssistant(DB_usage_assistant_runnable))
+    builder.add_node("DB_usage_assistant", BankingAssistant(DB_usage_assistant_runnable, "DB_usage_assistant").as_node())
     builder.add_edge("enter_DB_usage_assistant", "DB_usage_assistant")
 
     builder.add_node(
@@ -1,33 +1,54 @@
 import uuid
 from typing import List, Dict
 import gradio as gr
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import RunnableConfig
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 from langgraph.prebuilt import tools_condition
 from graph.assistant import BankingAssistant, primary_assistant_runnable, primary_assistant_tools
 from graph.base_data_model import ToTradingAssistant, ToAccountAssistant, ToDBUsageAssistant
+from graph.intent_router import fast_route, fast_route_intent
+from graph.checkpointer import create_checkpointer, start_checkpoint_compactor
 from graph.build_child_graph import build_trading_graph, build_account_graph, build_DB_usage_graph
-from tools import banking_data_excel, banking_data_db
+from tools import banking_data_excel, banking_data_db, DEFAULT_USER_ID, CHAT_CONCURRENCY, CHAT_ASYNC
 from tools.init_db import create_db_update_date
+from tools.resources import warm_up
+from tools.DB_usage_assistant_tools import start_faq_watcher
 from tools.primary_assistant_tools import fetch_user_information
+from tools.profile_cache import profile_cache
+from tools.tracing import tracer, tracing_callback, format_trace_summary
 from graph.state import State
 from tools.tools_handler import create_tool_node_with_fallback, _print_event
 
 # Initiate the graph
 builder = StateGraph(State)
-def get_user_info(state: State):
+def get_user_info(state: State, config: RunnableConfig):
     """
     Get client's bank account information and update state dictionary
     :param state: current state dict
-    :return: new state dict including client info
+    :param config: config with the user id
+    :return: new state dict including client info, its prompt fragment and the profile cache generation
     """
-    return {"user_info":fetch_user_information.invoke({})}
+    user_id = config.get("configurable", {}).get("user_id")
+    profile = profile_cache.get(user_id, lambda: fetch_user_information.invoke({}, config))
+    return {"user_info": profile.user_info, "user_info_prompt": profile.prompt, "user_info_version": profile.generation}
 
-#fetch_user_info is executed first, meaning we can get user's information before doing anything
+def route_start(state: State) -> str:
+    """
+    Load the client's information only when the conversation doesn't hold it yet or it was invalidated,
+    otherwise go straight to the current assistant.
+    :param state: dictionary of current dialog state
+    :return: the node name to go
+    """
+    if not state.get("user_info_prompt") or state.get("user_info_version") != profile_cache.generation:
+        return "fetch_user_info"
+    return route_to_workflow(state)
+
+#fetch_user_info is executed first in a conversation, meaning we can get user's information before doing anything
 builder.add_node('fetch_user_info', get_user_info)
 #add edges
-builder.add_edge(START, 'fetch_user_info')
+builder.add_conditional_edges(START, route_start)
 
 # add child graphs
 builder = build_trading_graph(builder)
@@ -35,7 +56,7 @@ builder = build_account_graph(builder)
 builder = build_DB_usage_graph(builder)
 
 #add primary assistant
-builder.add_node('primary_assistant', BankingAssistant(primary_assistant_runnable))
+builder.add_node('primary_assistant', BankingAssistant(primary_assistant_runnable, 'primary_assistant').as_node())
 builder.add_node('primary_assistant_tools', create_tool_node_with_fallback(primary_assistant_tools))
 
 # route for primary assistant
@@ -82,13 +103,27 @@ def route_to_workflow(state: dict) -> str:
     """
     dialog_state = state.get("dialog_state")
     if not dialog_state:
+        if fast_route_intent(state):
+            return "fast_route"  # the local intent router is confident, skip the primary assistant's LLM
         return "primary_assistant"  # of no dialog state, return to main assistant
     return dialog_state[-1]  # otherwise return to the last assistant
 
 builder.add_conditional_edges("fetch_user_info", route_to_workflow)  # route based on user info
 
-# Add memory saver and compile the graph
-memory = MemorySaver()
+# hand over to a specialist found by the local intent router, through the usual entry node
+builder.add_node('fast_route', fast_route)
+builder.add_conditional_edges(
+    "fast_route",
+    route_primary_assistant,
+    [
+        "enter_trading_assistant",
+        "enter_account_assistant",
+        "enter_DB_usage_assistant",
+    ]
+)
+
+# Add the checkpointer (SQLite file or process memory, see CHECKPOINTER) and compile the graph
+memory = create_checkpointer()
 graph = builder.compile(
     checkpointer=memory,
     interrupt_before = [
@@ -97,13 +132,15 @@ graph = builder.compile(
     ]
 )
 
-# Preparation before launching: initialize session_id and refresh database
-session_id = str(uuid.uuid4())
+# Nodes whose LLM replies are streamed to the UI
+assistant_nodes = {name for name in graph.nodes if name.endswith("_assistant") and not name.startswith("enter_")}
+
+# Preparation before launching: refresh database
 create_db_update_date(banking_data_excel, banking_data_db)
 
 # Set up config
 """
-4 client personas are available in config:
+4 client personas are available in the Client dropdown, DEFAULT_USER_ID is selected for a new session:
 - Luis Zhang (ID: AB123) -  A young working professional with an active lifestyle and diverse personal interests. 
   His investment portfolio is primarily concentrated in technology sector equities.
 
@@ -116,16 +153,37 @@ create_db_update_date(banking_data_excel, banking_data_db)
 - John Petrov (ID: PB519) A middle-aged blue-collar worker who prefers to keep his finances simple.
   He has no active interest in investment products and maintains a straightforward banking profile.
 """
-config = {
-    "configurable": {
-        "user_id": "AB123",
-        # "user_id": "PB367",
-        # "user_id": "PB519",
-        # "user_id": "AB892",
-        "thread_id": session_id,
-    }
+personas = {
+    "Luis Zhang (AB123)": "AB123",
+    "Jun-hao Mariano (PB367)": "PB367",
+    "Satsuki Ukeja (AB892)": "AB892",
+    "John Petrov (PB519)": "PB519",
 }
 
+def new_session(user_id: str = DEFAULT_USER_ID) -> dict:
+    """
+    Create the state of one conversation: every browser session gets its own LangGraph thread.
+    :param user_id: the client chatting
+    :return: session dict with thread_id, user_id and terminated flag
+    """
+    return {"thread_id": str(uuid.uuid4()), "user_id": user_id, "terminated": False}
+
+def session_config(session: dict) -> dict:
+    """
+    Build the graph config of a session.
+    :param session: session dict created by new_session()
+    :return: config with the user id and the thread id of the session, and the tracing callbacks when tracing is on
+    """
+    config = {
+        "configurable": {
+            "user_id": session["user_id"],
+            "thread_id": session["thread_id"],
+        }
+    }
+    if tracer.enabled:
+        config["callbacks"] = [tracing_callback]
+    return config
+
 # # TODO: Chatbot in terminal
 # _printed = set() #initiate a set, to avoid duplicate printing
 #
@@ -188,7 +246,6 @@ config = {
 #                     _print_event(event, _printed)
 
 # TODO: Chatbot in GUI by gradio
-config["configurable"]["terminated"] = False
 def do_graph(user_input, chat_bot):
     """
     function to execute after input is submitted
@@ -197,36 +254,115 @@ def do_graph(user_input, chat_bot):
         chat_bot.append({'role':'user', 'content': user_input})
     return '', chat_bot
 
-def execute_graph(chat_bot: List[Dict]) -> List[Dict]:
+def execute_graph(chat_bot: List[Dict], session: dict):
     """
-    function to execute the workflow
+    function to execute the workflow, in the thread of the browser session,
+    yields the chatbot every time the streamed reply grows
     """
     # Skip execution if terminated
-    if config["configurable"].get("terminated"):
-        return chat_bot
+    if session["terminated"]:
+        yield chat_bot
+        return
+    config = session_config(session)
 
-    user_input = chat_bot[-1]['content']
     result = '' #AI assistant last message
+    tokens = TokenStream()
+    reply = {'role':'assistant', 'content': ''}
+    for mode, payload in graph.stream(_graph_input(chat_bot), config, stream_mode = ["values", "messages"]):
+        if mode == "values":
+            result = _log_event(payload, result)
+        elif tokens.add(*payload):
+            yield _show(chat_bot, reply, tokens.text)
 
-    if user_input.strip().lower() !='y': #regular user question
-        events = graph.stream({"messages": ("user", user_input)}, config, stream_mode = "values")
-    else: # user inputs 'y':
-        events = graph.stream(None, config, stream_mode="values")
-
-    for event in events:
-        messages = event.get("messages")
-        if messages:
-            if isinstance(messages, list):
-                message = messages[-1]
-            if message.__class__.__name__ == "AIMessage":
-                if message.content:
-                    result = message.content #messages that needs to display in web UI
-            msg_repr = message.pretty_repr(html = True)
-            if len(msg_repr) > 1500:
-                msg_repr = msg_repr[:1500] + "... and more."
-            print(msg_repr)
-
-    current_state = graph.get_state(config)
+    yield _show(chat_bot, reply, _reply(graph.get_state(config), result))
+
+async def aexecute_graph(chat_bot: List[Dict], session: dict):
+    """
+    async version of execute_graph(), run on the event loop of the Gradio server:
+    a conversation waiting on the LLM or a quote does not hold a worker thread
+    """
+    if session["terminated"]:
+        yield chat_bot
+        return
+    config = session_config(session)
+
+    result = ''
+    tokens = TokenStream()
+    reply = {'role':'assistant', 'content': ''}
+    async for mode, payload in graph.astream(_graph_input(chat_bot), config, stream_mode = ["values", "messages"]):
+        if mode == "values":
+            result = _log_event(payload, result)
+        elif tokens.add(*payload):
+            yield _show(chat_bot, reply, tokens.text)
+
+    yield _show(chat_bot, reply, _reply(await graph.aget_state(config), result))
+
+class TokenStream:
+    """
+    Text of the AI message being generated, accumulated from the chunks of the "messages" stream mode.
+    Only the assistants' own replies are shown: tool results, handoffs and other tool calls are suppressed,
+    and so are LLM calls made inside tools (e.g. the stock analysis of search_stock).
+    """
+    def __init__(self):
+        self.text = ''
+        self._message_id = None
+        self._hidden = False
+
+    def add(self, message, metadata: dict) -> bool:
+        """
+        Add a streamed message chunk
+        :param message: chunk of the "messages" stream mode
+        :param metadata: its metadata, with the name of the node that produced it
+        :return: whether the text to display changed
+        """
+        if not isinstance(message, AIMessage) or metadata.get("langgraph_node") not in assistant_nodes:
+            return False
+        previous = self.text
+        if message.id != self._message_id:
+            # next LLM hop, e.g. the specialist answering after the handoff
+            self._message_id, self._hidden, self.text = message.id, False, ''
+        if message.tool_calls or getattr(message, "tool_call_chunks", None):
+            # a tool call or a handoff, its text is not the reply
+            self._hidden = True
+        content = message.content if isinstance(message.content, str) else "".join(
+            part.get("text", "") for part in message.content if isinstance(part, dict))
+        # a chunk extends the message, a whole message (not streamed by the model) replaces it
+        self.text = self.text + content if isinstance(message, AIMessageChunk) else content
+        if self._hidden:
+            self.text = ''
+        return self.text != previous
+
+def _show(chat_bot: List[Dict], reply: Dict, content: str) -> List[Dict]:
+    # update the reply of the current turn, added after the user's message on the first update
+    reply['content'] = content
+    if not chat_bot or chat_bot[-1] is not reply:
+        chat_bot.append(reply)
+    return chat_bot
+
+def _graph_input(chat_bot: List[Dict]):
+    # a regular user question starts a new turn, 'y' resumes the interrupted one
+    user_input = chat_bot[-1]['content']
+    if user_input.strip().lower() !='y':
+        return {"messages": ("user", user_input)}
+    return None
+
+def _log_event(event: dict, result: str) -> str:
+    # print the last message of a streamed state, return the latest AI answer
+    messages = event.get("messages")
+    if messages:
+        if isinstance(messages, list):
+            message = messages[-1]
+        if message.__class__.__name__ == "AIMessage":
+            if message.content:
+                result = message.content #messages that needs to display in web UI
+        msg_repr = message.pretty_repr(html = True)
+        if len(msg_repr) > 1500:
+            msg_repr = msg_repr[:1500] + "... and more."
+        print(msg_repr)
+    return result
+
+def _reply(current_state, result: str) -> str:
+    # the answer to display, or the consent request when a sensitive tool interrupted the graph
     if current_state.next: #interruption happens
         # Create custom messages for different nodes before interruption
         approval_messages = {
@@ -249,9 +385,7 @@ def execute_graph(chat_bot: List[Dict]) -> List[Dict]:
             "Do you approve the above operation? Input 'y' to continue, otherwise specify your requests.\n"
         )
 
-    chat_bot.append({'role':'assistant', 'content': result})
-
-    return chat_bot
+    return result
 
 
 # Build a GUI with gradio
@@ -263,6 +397,12 @@ css = """
 with (gr.Blocks(title='Digital Banking Assistant', css=css) as instance): #set up the page title with css, we have an HTML page
     gr.Label('Digital Banking Assistant', container=False) #header of the page
 
+    # conversation state of this browser session
+    session_state = gr.State(new_session)
+
+    persona_dropdown = gr.Dropdown(choices=list(personas), label='Client',
+                                   value=next((name for name, uid in personas.items() if uid == DEFAULT_USER_ID), None))
+
     chatbot = gr.Chatbot(type='messages', height=350, label = 'AI Assistant') #chatbot widget
 
     input_textbox = gr.Textbox(label='Please input your question.📝', value='') #input box
@@ -270,14 +410,20 @@ with (gr.Blocks(title='Digital Banking Assistant', css=css) as instance): #set u
     input_textbox.submit(do_graph,
                          [input_textbox, chatbot],
                          [input_textbox, chatbot]
-                         ).then(execute_graph, chatbot, chatbot)
+                         ).then(aexecute_graph if CHAT_ASYNC else execute_graph, [chatbot, session_state], chatbot)
+
+    def switch_persona(persona):
+        # a new client starts a new conversation
+        return new_session(personas[persona]), []
+
+    persona_dropdown.change(switch_persona, persona_dropdown, [session_state, chatbot])
 
     with gr.Row():
         gr.Column(scale=1)  # empty spacer column
         with gr.Column(scale=0):  # button column, won't stretch
             quit_button = gr.Button("End the chat", elem_id="quit-btn")
-    def quit_chat(chat_bot):
-        config["configurable"]["terminated"] = True
+    def quit_chat(chat_bot, session):
+        session["terminated"] = True
         chat_bot.append({
             'role': 'user',
             'content': 'End the chat'
@@ -286,10 +432,21 @@ with (gr.Blocks(title='Digital Banking Assistant', css=css) as instance): #set u
             'role': 'assistant',
             'content':"Thank you for using the Digital Banking Assistant. Wish you have a good day!"
         })
-        return chat_bot
+        if tracer.enabled:
+            # latency of the graph nodes so far, across all sessions of the process
+            print(format_trace_summary("node"))
+        return chat_bot, session
 
-    quit_button.click(quit_chat, chatbot, chatbot)
+    quit_button.click(quit_chat, [chatbot, session_state], [chatbot, session_state])
 
 if __name__=='__main__':
+    # create the lazy resources (FAQ index, embedding client, market data provider, pandas) before serving,
+    # so the first user doesn't pay for them
+    print(f"Warm-up (seconds): {warm_up()}")
+    # reload the FAQ index when digital_banking_FAQ.md is edited
+    start_faq_watcher()
+    # expire idle conversations and prune old checkpoints in the background
+    start_checkpoint_compactor(memory)
     #launch the gradio app
-    instance.launch(debug=True)
\ No newline at end of file
+    # conversations of different sessions run in parallel, each on its own thread_id
+    instance.queue(default_concurrency_limit=CHAT_CONCURRENCY).launch(debug=True)
\ No newline at end of file
@@ -0,0 +1,326 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, Sequence
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata,
+                                       CheckpointTuple, WRITES_IDX_MAP, get_checkpoint_id, get_checkpoint_metadata)
+from langgraph.checkpoint.memory import MemorySaver
+from tools import (CHECKPOINTER, CHECKPOINT_DB, CHECKPOINT_KEEP_LATEST, CHECKPOINT_THREAD_TTL,
+                   CHECKPOINT_COMPACT_INTERVAL)
+from tools.db_connection import ConnectionPool
+
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    parent_checkpoint_id TEXT,
+    type TEXT,
+    checkpoint BLOB,
+    metadata_type TEXT,
+    metadata BLOB,
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+);
+CREATE TABLE IF NOT EXISTS writes (
+    thread_id TEXT NOT NULL,
+    checkpoint_ns TEXT NOT NULL DEFAULT '',
+    checkpoint_id TEXT NOT NULL,
+    task_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    channel TEXT NOT NULL,
+    type TEXT,
+    value BLOB,
+    task_path TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+);
+CREATE TABLE IF NOT EXISTS threads (
+    thread_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_threads_updated_at ON threads (updated_at);
+"""
+
+def _config(thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint_id}}
+
+class SqliteCheckpointSaver(BaseCheckpointSaver[str]):
+    """
+    LangGraph checkpointer persisting the conversations to a SQLite file,
+    so pending approvals survive a restart and the history does not live in process memory.
+    Retention: only the latest keep_latest checkpoints of a thread are kept (older ones are pruned on every write),
+    and threads idle for longer than thread_ttl seconds are deleted by compact().
+    """
+    def __init__(self, db_path: str = CHECKPOINT_DB, keep_latest: int = CHECKPOINT_KEEP_LATEST,
+                 thread_ttl: float = CHECKPOINT_THREAD_TTL, **kwargs):
+        """
+        Initialize the checkpointer and create its tables
+        :param db_path: path of the SQLite file, separate from the banking database which is rebuilt from Excel
+        :param keep_latest: checkpoints kept per thread, 0 keeps all of them
+        :param thread_ttl: seconds after the last write before a thread expires, 0 never expires threads
+        """
+        super().__init__(**kwargs)
+        self.pool = ConnectionPool(db_path)
+        self.keep_latest = keep_latest
+        self.thread_ttl = thread_ttl
+        self.pruned = 0  # checkpoints removed by the retention
+        self.expired = 0  # threads removed by the TTL
+        with self.pool.connection() as conn:
+            conn.executescript(CHECKPOINT_SCHEMA)
+
+    def _tuple(self, conn, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        # build a CheckpointTuple from a checkpoints row, with the pending writes of the checkpoint
+        checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? ORDER BY task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config=_config(thread_id, checkpoint_ns, checkpoint_id),
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=_config(thread_id, checkpoint_ns, parent_checkpoint_id) if parent_checkpoint_id else None,
+            pending_writes=[(task_id, channel, self.serde.loads_typed((t, v))) for task_id, channel, t, v in writes],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        """Get the checkpoint of the config, the latest one of the thread if the config has no checkpoint id."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        query = ("SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata "
+                 "FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?")
+        params = [thread_id, checkpoint_ns]
+        if checkpoint_id := get_checkpoint_id(config):
+            query += " AND checkpoint_id = ?"
+            params.append(checkpoint_id)
+        else:
+            query += " ORDER BY checkpoint_id DESC LIMIT 1"
+        with self.pool.connection() as conn:
+            row = conn.execute(query, params).fetchone()
+            return self._tuple(conn, thread_id, checkpoint_ns, row) if row else None
+
+    def list(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+             before: RunnableConfig | None = None, limit: int | None = None) -> Iterator[CheckpointTuple]:
+        """List the checkpoints, newest first, of the thread of the config or of all threads."""
+        query = ("SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+                 "metadata_type, metadata FROM checkpoints WHERE 1 = 1")
+        params = []
+        if config:
+            query += " AND thread_id = ?"
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                query += " AND checkpoint_ns = ?"
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                query += " AND checkpoint_id = ?"
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            query += " AND checkpoint_id < ?"
+            params.append(before_id)
+        query += " ORDER BY thread_id, checkpoint_ns, checkpoint_id DESC"
+        results = []
+        with self.pool.connection() as conn:
+            for thread_id, checkpoint_ns, *row in conn.execute(query, params).fetchall():
+                if limit is not None and len(results) >= limit:
+                    break
+                checkpoint_tuple = self._tuple(conn, thread_id, checkpoint_ns, row)
+                # metadata is stored serialized, so it is filtered here
+                if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(checkpoint_tuple)
+        # the connection goes back to the pool before the caller iterates
+        yield from results
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Save a checkpoint, touch its thread and prune the checkpoints beyond the retention."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        type_, blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (thread_id, checkpoint_ns, checkpoint["id"], config["configurable"].get("checkpoint_id"),
+                 type_, blob, metadata_type, metadata_blob),
+            )
+            conn.execute("INSERT OR REPLACE INTO threads VALUES (?, ?)", (thread_id, time.time()))
+            if self.keep_latest:
+                self.pruned += self._prune(conn, thread_id, checkpoint_ns)
+        return _config(thread_id, checkpoint_ns, checkpoint["id"])
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Save the intermediate writes of a task, linked to the checkpoint of the config."""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # special writes (errors, interrupts) replace the previous ones, regular writes are saved once per task
+        rows = {"REPLACE": [], "IGNORE": []}
+        for idx, (channel, value) in enumerate(writes):
+            type_, blob = self.serde.dumps_typed(value)
+            rows["REPLACE" if channel in WRITES_IDX_MAP else "IGNORE"].append(
+                (thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                 channel, type_, blob, task_path))
+        with self.pool.connection() as conn:
+            for conflict, conflict_rows in rows.items():
+                conn.executemany(f"INSERT OR {conflict} INTO writes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", conflict_rows)
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete all checkpoints and writes of a thread."""
+        with self.pool.connection() as conn:
+            self._delete_threads(conn, [thread_id])
+
+    @staticmethod
+    def _delete_threads(conn, thread_ids: Sequence[str]):
+        for table in ("checkpoints", "writes", "threads"):
+            conn.executemany(f"DELETE FROM {table} WHERE thread_id = ?", [(thread_id,) for thread_id in thread_ids])
+
+    def _prune(self, conn, thread_id: str, checkpoint_ns: str) -> int:
+        # delete the checkpoints of a thread older than the latest keep_latest, and their writes
+        stale = conn.execute(
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+            (thread_id, checkpoint_ns, self.keep_latest),
+        ).fetchall()
+        for table in ("checkpoints", "writes"):
+            conn.executemany(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id, in stale],
+            )
+        return len(stale)
+
+    def compact(self) -> dict:
+        """
+        Expire the idle threads, re-apply the retention to all threads, and give the freed pages back to the file system.
+        :return: number of expired threads, pruned checkpoints and remaining threads
+        """
+        with self.pool.connection() as conn:
+            expired = []
+            if self.thread_ttl:
+                expired = [thread_id for thread_id, in conn.execute(
+                    "SELECT thread_id FROM threads WHERE updated_at < ?", (time.time() - self.thread_ttl,))]
+                self._delete_threads(conn, expired)
+            pruned = 0
+            if self.keep_latest:
+                for thread_id, checkpoint_ns in conn.execute(
+                        "SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints").fetchall():
+                    pruned += self._prune(conn, thread_id, checkpoint_ns)
+            # orphan writes of checkpoints that no longer exist
+            conn.execute(
+                "DELETE FROM writes WHERE NOT EXISTS (SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id "
+                "AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id)"
+            )
+            threads = conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            conn.commit()
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            # rewrite the file only once a quarter of it is free pages
+            free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if free_pages * 4 > conn.execute("PRAGMA page_count").fetchone()[0]:
+                conn.execute("VACUUM")
+        self.expired += len(expired)
+        self.pruned += pruned
+        return {"expired_threads": len(expired), "pruned_checkpoints": pruned, "threads": threads}
+
+    def stats(self) -> dict:
+        """Return the number of stored threads and checkpoints and the retention counters."""
+        with self.pool.connection() as conn:
+            threads = conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0]
+            checkpoints = conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+        return {"threads": threads, "checkpoints": checkpoints, "pruned": self.pruned, "expired": self.expired}
+
+    # SQLite has no async driver here, the async methods run the sync ones in a worker thread
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+                    before: RunnableConfig | None = None, limit: int | None = None) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    def get_next_version(self, current: str | None, channel: None) -> str:
+        # same version format as MemorySaver: an increasing counter and a random suffix
+        current_v = 0 if current is None else current if isinstance(current, int) else int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+class CheckpointCompactor:
+    """
+    Background thread running SqliteCheckpointSaver.compact() periodically.
+    """
+    def __init__(self, saver: SqliteCheckpointSaver, interval: float = CHECKPOINT_COMPACT_INTERVAL):
+        """
+        Initialize the compactor
+        :param saver: the checkpointer to compact
+        :param interval: seconds between two compactions
+        """
+        self.saver = saver
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.errors = 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                result = self.saver.compact()
+                self.runs += 1
+                if result["expired_threads"] or result["pruned_checkpoints"]:
+                    print(f"Checkpoints compacted: {result}")
+            except Exception as e:
+                # keep serving, the next run tries again
+                self.errors += 1
+                print(f"Checkpoint compaction failed: {type(e).__name__}: {e}")
+
+    def start(self):
+        """Start compacting in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="checkpoint-compactor", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop compacting."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def create_checkpointer(kind: str = CHECKPOINTER) -> BaseCheckpointSaver:
+    """
+    Create the checkpointer of the graph.
+    :param kind: 'sqlite' (persistent, with retention) or 'memory' (in process, nothing survives a restart)
+    :return: the checkpointer
+    """
+    if kind == "sqlite":
+        return SqliteCheckpointSaver()
+    if kind == "memory":
+        return MemorySaver()
+    raise ValueError(f"Unknown checkpointer '{kind}', use 'sqlite' or 'memory'")
+
+def start_checkpoint_compactor(saver: BaseCheckpointSaver,
+                               interval: float = CHECKPOINT_COMPACT_INTERVAL) -> CheckpointCompactor | None:
+    """
+    Start compacting the checkpoints in the background.
+    :param saver: the checkpointer of the graph, only a SqliteCheckpointSaver is compacted
+    :param interval: seconds between two compactions, 0 disables the compactor
+    :return: the running compactor, None if disabled
+    """
+    if interval <= 0 or not isinstance(saver, SqliteCheckpointSaver):
+        return None
+    compactor = CheckpointCompactor(saver, interval)
+    compactor.start()
+    return compactor
@@ -0,0 +1,141 @@
+from langchain_core.messages import AIMessage, AnyMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable
+from langgraph.constants import TAG_NOSTREAM
+from graph.base_data_model import ToTradingAssistant, ToAccountAssistant, ToDBUsageAssistant
+from graph.llm import llm
+from tools import CONTEXT_MAX_TOKENS, CONTEXT_FOLD_RATIO, CONTEXT_SUMMARY_MAX_TOKENS
+
+# Tool calls that hand the conversation over to a specialist, answered by the ToolMessage of its entry node
+HANDOFF_TOOLS = {ToTradingAssistant.__name__, ToAccountAssistant.__name__, ToDBUsageAssistant.__name__}
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You maintain the running summary of a conversation between a bank client and the bank's digital assistants."
+            "\nUpdate the summary below with the new messages. Keep every fact the assistants may still need: "
+            "the client's requests and whether they were completed, account numbers, stock names, amounts, prices, dates, "
+            "orders and transfers submitted or pending, and what the client approved or declined. "
+            "Drop greetings and tool instructions. Write at most {max_tokens} tokens of plain sentences."
+            "\n<Summary>\n{summary}\n</Summary>"
+        ),
+        ("placeholder", "{messages}"),
+        ("user", "Write the updated summary."),
+    ]
+)
+
+# The summary is never streamed to the chat
+summary_runnable = (summary_prompt | llm).with_config(tags=[TAG_NOSTREAM], run_name="context_summary")
+
+def _turn_starts(messages: list[AnyMessage]) -> list[int]:
+    # a turn starts at a user message, so a tool call and its tool messages are never split
+    return [i for i, message in enumerate(messages) if isinstance(message, HumanMessage)]
+
+def _handoff_frame(messages: list[AnyMessage]) -> list[AnyMessage]:
+    # the latest handoff to a specialist: the AI tool call and the ToolMessage of the entry node answering it
+    for i in range(len(messages) - 1, -1, -1):
+        message = messages[i]
+        if isinstance(message, AIMessage) and any(call["name"] in HANDOFF_TOOLS for call in message.tool_calls):
+            ids = {call["id"] for call in message.tool_calls}
+            answers = [m for m in messages[i + 1:] if isinstance(m, ToolMessage) and m.tool_call_id in ids]
+            return [message] + answers
+    return []
+
+class ContextWindow:
+    """
+    Keeps the prompt of an assistant within a token budget.
+    The system prompt with user_info, the frame of the current specialist (its handoff and entry message)
+    and the most recent turns are sent as they are; older turns are folded into a rolling summary stored in the state,
+    so every turn is summarized once instead of being re-sent on every LLM call.
+    """
+    def __init__(self, max_tokens: int = CONTEXT_MAX_TOKENS, fold_ratio: float = CONTEXT_FOLD_RATIO,
+                 summary_max_tokens: int = CONTEXT_SUMMARY_MAX_TOKENS, summarizer: Runnable = None):
+        """
+        Initialize the window
+        :param max_tokens: budget of the whole prompt, 0 sends the full conversation
+        :param fold_ratio: share of the budget left to the messages after folding, lower folds more turns at once
+        :param summary_max_tokens: length asked for the summary
+        :param summarizer: runnable turning the previous summary and the folded messages into the new summary
+        """
+        self.max_tokens = max_tokens
+        self.fold_ratio = fold_ratio
+        self.summary_max_tokens = summary_max_tokens
+        self.summarizer = summarizer or summary_runnable
+        self.folds = 0  # number of summary updates
+
+    def _fixed_tokens(self, prompt: Runnable, state: dict) -> int:
+        # the system prompt rendered with user_info, without the conversation
+        if prompt is None:
+            return 0
+        return count_tokens_approximately(prompt.invoke({**state, "messages": []}).to_messages())
+
+    def _plan(self, prompt: Runnable, state: dict) -> tuple[list, list, dict]:
+        """
+        Decide what to send.
+        :return: the messages to fold into the summary (empty if none), the messages kept, and the current summary
+        """
+        messages = state["messages"]
+        summary = state.get("context_summary") or {}
+        ids = [message.id for message in messages]
+        start = ids.index(summary["through"]) + 1 if summary.get("through") in ids else 0
+        budget = self.max_tokens - self._fixed_tokens(prompt, state) - count_tokens_approximately(
+            [SystemMessage(summary.get("text", ""))])
+        window = messages[start:]
+        if count_tokens_approximately(window) <= budget:
+            return [], window, summary
+
+        # fold the oldest turns until the rest fits in a fraction of the budget, keeping at least the current turn
+        target = budget * self.fold_ratio
+        starts = [i for i in _turn_starts(messages) if i > start]
+        cut = start
+        for turn_start in starts:
+            cut = turn_start
+            if count_tokens_approximately(messages[cut:]) <= target:
+                break
+        return messages[start:cut], messages[cut:], summary
+
+    def _window(self, messages: list[AnyMessage], kept: list[AnyMessage], summary_text: str) -> list[AnyMessage]:
+        # the summary, then the frame of the current specialist if it was folded, then the recent turns
+        window = []
+        if summary_text:
+            window.append(SystemMessage(f"Summary of the earlier conversation:\n{summary_text}"))
+        kept_ids = {message.id for message in kept}
+        frame = _handoff_frame(messages)
+        if frame and frame[0].id not in kept_ids:
+            window += frame
+        return window + kept
+
+    def _summary_input(self, summary: dict, folded: list[AnyMessage]) -> dict:
+        return {"summary": summary.get("text", "(empty)"), "messages": folded, "max_tokens": self.summary_max_tokens}
+
+    def _result(self, state: dict, folded: list, kept: list, summary: dict, text: str = None) -> tuple[dict, dict]:
+        update = {}
+        if folded:
+            self.folds += 1
+            summary = {"text": text, "through": folded[-1].id}
+            update = {"context_summary": summary}
+        window = self._window(state["messages"], kept, summary.get("text", ""))
+        return {**state, "messages": window}, update
+
+    def prepare(self, state: dict, prompt: Runnable = None) -> tuple[dict, dict]:
+        """
+        Fit the state of an assistant into the budget.
+        :param state: the graph state
+        :param prompt: the prompt template of the assistant, to count the system prompt and user_info
+        :return: the state to send to the assistant, and the state update holding the new summary (empty if unchanged)
+        """
+        if not self.max_tokens:
+            return state, {}
+        folded, kept, summary = self._plan(prompt, state)
+        text = self.summarizer.invoke(self._summary_input(summary, folded)).content if folded else None
+        return self._result(state, folded, kept, summary, text)
+
+    async def aprepare(self, state: dict, prompt: Runnable = None) -> tuple[dict, dict]:
+        """Async version of prepare(), the summary call is awaited."""
+        if not self.max_tokens:
+            return state, {}
+        folded, kept, summary = self._plan(prompt, state)
+        text = (await self.summarizer.ainvoke(self._summary_input(summary, folded))).content if folded else None
+        return self._result(state, folded, kept, summary, text)
@@ -0,0 +1,106 @@
+import json
+import uuid
+from dataclasses import dataclass
+import numpy as np
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableConfig
+from graph.base_data_model import ToTradingAssistant, ToAccountAssistant, ToDBUsageAssistant
+from tools import INTENT_ROUTER, INTENT_EXAMPLES, INTENT_MIN_SIMILARITY, INTENT_MIN_MARGIN
+from tools.embedding_backends import HashedTfidfBackend
+from tools.resources import LazyResource
+from tools.vector_index import prepare_vectors
+
+# Handoff tool of every specialist the router can route to
+HANDOFFS = {
+    "trading_assistant": ToTradingAssistant,
+    "account_assistant": ToAccountAssistant,
+    "DB_usage_assistant": ToDBUsageAssistant,
+}
+
+@dataclass(frozen=True)
+class Intent:
+    """Result of IntentRouter.classify()."""
+    assistant: str  # the closest assistant, primary_assistant for requests the primary assistant handles itself
+    action: str  # action of the closest example of that assistant
+    similarity: float  # cosine similarity of the closest example
+    margin: float  # similarity gap to the closest example of another assistant
+    confident: bool  # whether to hand over to the specialist without asking the LLM
+
+class IntentRouter:
+    """
+    Local classifier of user requests: nearest labeled examples in the hashed TF-IDF space of the examples.
+    A request close to the examples of one specialist, and clearly closer than to any other assistant,
+    is handed over to that specialist directly; everything else goes through the primary assistant's LLM.
+    """
+    def __init__(self, examples: list[dict], min_similarity: float = INTENT_MIN_SIMILARITY,
+                 min_margin: float = INTENT_MIN_MARGIN):
+        """
+        Fit the classifier
+        :param examples: labeled utterances with 'text', 'assistant' and 'action'
+        :param min_similarity: similarity of the closest example needed to route locally
+        :param min_margin: gap to the closest example of another assistant needed to route locally
+        """
+        self.examples = examples
+        self.min_similarity = min_similarity
+        self.min_margin = min_margin
+        texts = [example["text"] for example in examples]
+        self.backend = HashedTfidfBackend()
+        self.backend.fit(texts)
+        self.matrix = prepare_vectors(self.backend.embed_documents(texts))
+        self.assistants = np.array([example["assistant"] for example in examples])
+
+    @classmethod
+    def from_file(cls, path: str = INTENT_EXAMPLES, **kwargs):
+        """Fit the classifier on a JSON file of labeled utterances."""
+        with open(path, encoding="utf8") as f:
+            return cls(json.load(f), **kwargs)
+
+    def classify(self, text: str) -> Intent:
+        """
+        Classify a user request.
+        :param text: the request
+        :return: the closest assistant and whether the match is confident
+        """
+        scores = self.matrix @ prepare_vectors(self.backend.embed_query(text))
+        best = int(np.argmax(scores))
+        assistant = self.assistants[best]
+        others = scores[self.assistants != assistant]
+        similarity = float(scores[best])
+        margin = similarity - float(others.max()) if len(others) else similarity
+        confident = (assistant in HANDOFFS and similarity >= self.min_similarity and margin >= self.min_margin)
+        return Intent(assistant=str(assistant), action=self.examples[best]["action"], similarity=similarity,
+                      margin=margin, confident=confident)
+
+# Fitted on first use, warm_up() fits it ahead of the first request
+router = LazyResource("intent_router", IntentRouter.from_file)
+
+def fast_route_intent(state: dict) -> Intent | None:
+    """
+    Classify the new user request of a conversation with the primary assistant.
+    :param state: the graph state
+    :return: the confident intent, None if the LLM should decide
+    """
+    if not INTENT_ROUTER or state.get("dialog_state"):
+        # disabled, or a specialist is already handling the conversation
+        return None
+    messages = state.get("messages") or []
+    if not messages or not isinstance(messages[-1], HumanMessage) or not isinstance(messages[-1].content, str):
+        return None
+    intent = router.classify(messages[-1].content)
+    return intent if intent.confident else None
+
+def fast_route(state: dict, config: RunnableConfig) -> dict:
+    """
+    Hand the request over to the specialist found by the intent router, with the same tool call the primary assistant's
+    LLM would have made, so the entry node and the specialist see the usual handoff.
+    :param state: the graph state, routed here by route_to_workflow only when fast_route_intent() is confident
+    :param config: config with the user id
+    :return: the handoff message
+    """
+    request = state["messages"][-1].content
+    intent = router.classify(request)
+    args = {"request": request}
+    if intent.assistant != "DB_usage_assistant":
+        args.update(user_id=config.get("configurable", {}).get("user_id"), action=intent.action)
+    tool_call = {"name": HANDOFFS[intent.assistant].__name__, "args": args, "id": f"fast_route_{uuid.uuid4().hex}"}
+    return {"messages": AIMessage(content="", tool_calls=[tool_call])}
@@ -0,0 +1,27 @@
+import time
+from dataclasses import dataclass
+from tools import ASSISTANT_MAX_ATTEMPTS, ASSISTANT_RETRY_BACKOFF, ASSISTANT_RETRY_MAX_BACKOFF, ASSISTANT_DEADLINE
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Bounds the retries of an assistant whose model returns neither content nor a tool call.
+    """
+    max_attempts: int = ASSISTANT_MAX_ATTEMPTS  # LLM calls per node run, the first one included
+    backoff: float = ASSISTANT_RETRY_BACKOFF  # seconds before the first retry, doubled for every next one
+    max_backoff: float = ASSISTANT_RETRY_MAX_BACKOFF  # cap of the wait between two retries
+    deadline: float = ASSISTANT_DEADLINE  # seconds a node run may spend retrying, 0 for no deadline
+
+    def next_delay(self, attempt: int, started: float) -> float | None:
+        """
+        Decide whether to retry after a failed attempt.
+        :param attempt: number of the attempt that failed, starting at 1
+        :param started: time.monotonic() when the node run started
+        :return: seconds to wait before the next attempt, None when the attempts or the deadline are exhausted
+        """
+        if attempt >= self.max_attempts:
+            return None
+        delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+        if self.deadline and time.monotonic() - started + delay > self.deadline:
+            return None
+        return delay
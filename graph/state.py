@@ -23,10 +23,15 @@ class State(TypedDict):
     :param
     messages: list of messages
     user_info: user information
+    user_info_prompt: user information rendered once for the assistants' prompts
+    user_info_version: generation of the profile cache the user information was loaded in
     dialog_state: agent that is the current dialog
+    context_summary: rolling summary of the turns folded out of the assistants' context window, and the id of the last folded message
     """
     messages: Annotated[list[AnyMessage], add_messages]
     user_info: List[Dict[str, Any]]
+    user_info_prompt: str
+    user_info_version: int
     dialog_state: Annotated[
         list[Literal[
             "primary_assistant",
@@ -35,4 +40,5 @@ class State(TypedDict):
             "DB_usage_assistant"
         ]],
         update_dialog_stack
-    ]
\ No newline at end of file
+    ]
+    context_summary: Dict[str, Any]
\ No newline at end of file
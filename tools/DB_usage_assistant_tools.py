@@ -1,50 +1,275 @@
+import copy
 import os
 import re
+import threading
+from collections import Counter
 import numpy as np
 from dotenv import load_dotenv
 from langchain_core.tools import tool
-from langchain_openai import OpenAIEmbeddings
 
-from tools import digital_banking_FAQ, OPENAI_API_KEY
+from tools import (digital_banking_FAQ, FAQ_EMBEDDINGS, FAQ_EMBEDDING_BACKEND, FAQ_QUERY_CACHE_SIZE, FAQ_QUERY_CACHE_PATH,
+                   FAQ_RETRIEVAL_MODE, BM25_MIN_COVERAGE, BM25_MIN_MARGIN, RRF_K, RRF_DEPTH, FAQ_RELOAD_INTERVAL,
+                   FAQ_VECTOR_DIM, FAQ_VECTOR_INDEX, FAQ_ANN_MIN_ROWS, FAQ_ANN_PROBES)
+from tools.bm25 import BM25Index
+from tools.embedding_backends import EmbeddingBackend, create_embedding_backend
+from tools.embedding_store import EmbeddingStore, QueryEmbeddingCache, section_hash
+from tools.resources import LazyResource
+from tools.tools_handler import async_implementation
+from tools.vector_index import prepare_vectors, build_index
 
-# read FAQ
-faq_text = None
-with open(digital_banking_FAQ, encoding='utf8') as f:
-    faq_text = f.read()
-# split FAQ to multiple docs
-docs = [{"page_content": txt} for txt in re.split(r"(?=\n###)", faq_text)] # split on ##
+def load_faq_docs(path: str = digital_banking_FAQ) -> list[dict]:
+    """
+    Read the FAQ and split it into docs, one per "###" section.
+    :param path: path of the FAQ markdown file
+    :return: list of docs with the section text as page_content
+    """
+    # read FAQ
+    with open(path, encoding='utf8') as f:
+        faq_text = f.read()
+    # split FAQ to multiple docs
+    return [{"page_content": txt} for txt in re.split(r"(?=\n###)", faq_text)] # split on ##
+
+# Set up embedding backend, selected by FAQ_EMBEDDING_BACKEND and created on first use
+embedding_backend = LazyResource("faq_embedding_backend", lambda: create_embedding_backend(FAQ_EMBEDDING_BACKEND))
+# Embeddings of recent queries, repeated questions skip the embedding call of a remote backend
+query_cache = LazyResource(
+    "faq_query_cache", lambda: QueryEmbeddingCache(embedding_backend.model_name, FAQ_QUERY_CACHE_SIZE, FAQ_QUERY_CACHE_PATH)
+)
 
-# Set up embedding
-embeddings_model = OpenAIEmbeddings(api_key = OPENAI_API_KEY)
+def faq_embeddings_path(backend: EmbeddingBackend) -> str:
+    """Path of the persisted FAQ embeddings of a backend, every backend has an index of its own."""
+    return FAQ_EMBEDDINGS.format(backend=backend.name)
 
 class VectorStoreRetriever:
-    def __init__(self, docs: list, vectors: list):
-        self._arr = np.array(vectors)
+    def __init__(self, docs: list, vectors: list, backend: EmbeddingBackend):
+        # contiguous, L2-normalized float32 matrix, optionally truncated to FAQ_VECTOR_DIM dimensions
+        self._arr = prepare_vectors(vectors, FAQ_VECTOR_DIM).reshape(len(docs), -1)
+        self._index = build_index(self._arr, FAQ_VECTOR_INDEX, FAQ_ANN_MIN_ROWS, FAQ_ANN_PROBES)
         self._docs = docs
+        self._backend = backend
+        # local lexical index over the same docs, answers confident keyword matches without an embedding call
+        self._bm25 = BM25Index([doc["page_content"] for doc in docs])
+        self.stats = {"lexical": 0, "fused": 0, "vector": 0}
 
     # @classmethod decorator is used to define a method that operates on the class itself rather than on instances of the class.
     @classmethod
-    def from_docs(cls, docs):
-        # generate embedded vectors from docs
-        embeddings = embeddings_model.embed_documents([doc["page_content"] for doc in docs])
-        vectors = embeddings
-        return cls(docs, vectors)
-
-    def query(self, query: str, k: int = 5) -> list[dict]:
-        # generated embedded vectors from query
-        embed = embeddings_model.embed_query(query)
-        # calculate similarity score between query vector and doc vectors
-        scores = np.array(embed) @ self._arr.T
-        # obtain the k docs with the highest similarity scores
+    def from_docs(cls, docs, backend: EmbeddingBackend = None):
+        # fit a copy, a retriever still serving queries keeps the backend state its vectors were made with
+        backend = copy.copy(backend or embedding_backend.get())
+        texts = [doc["page_content"] for doc in docs]
+        backend.fit(texts)
+        # load embedded vectors from the store of the backend, only new or changed docs are embedded
+        store = EmbeddingStore(faq_embeddings_path(backend), backend.model_name)
+        vectors = store.embed_documents(texts, backend.embed_documents)
+        instance = cls(docs, vectors, backend)
+        instance.embedded = store.embedded
+        return instance
+
+    def _embed_queries(self, queries: list[str]) -> np.ndarray:
+        # one embedding call for all queries, cached by normalized query text for a remote backend
+        if self._backend.remote:
+            vectors = query_cache.embed_queries(queries, self._backend.embed_documents)
+        else:
+            vectors = [self._backend.embed_query(query) for query in queries]
+        return prepare_vectors(vectors, FAQ_VECTOR_DIM).reshape(len(queries), -1)
+
+    async def _aembed_queries(self, queries: list[str]) -> np.ndarray:
+        # same as _embed_queries(), a remote backend is awaited, a local one is fast enough to run inline
+        if not self._backend.remote:
+            return self._embed_queries(queries)
+        vectors = await query_cache.aembed_queries(queries, self._backend.aembed_documents)
+        return prepare_vectors(vectors, FAQ_VECTOR_DIM).reshape(len(queries), -1)
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        # obtain the k docs with the highest scores, sorted
+        k = min(k, len(scores))
         top_k_idx = np.argpartition(scores, -k)[-k:]
-        top_k_idx_sorted = top_k_idx[np.argsort(-scores[top_k_idx])]
-        # return k docs with highest similarity scores and the scores
-        return [
-            {**self._docs[idx], "similarity": scores[idx]} for idx in top_k_idx_sorted
-        ]
+        return top_k_idx[np.argsort(-scores[top_k_idx])]
+
+    def _lexical_confident(self, query: str, bm25_scores: np.ndarray) -> bool:
+        # the best section holds most of the query terms and clearly beats the runner-up
+        if len(bm25_scores) == 0 or bm25_scores.max() <= 0:
+            return False
+        first, second = np.sort(bm25_scores)[::-1][:2] if len(bm25_scores) > 1 else (bm25_scores[0], 0.0)
+        return (self._bm25.coverage(query, int(np.argmax(bm25_scores))) >= BM25_MIN_COVERAGE
+                and first >= BM25_MIN_MARGIN * second)
+
+    def query(self, query: str, k: int = 5, mode: str = FAQ_RETRIEVAL_MODE) -> list[dict]:
+        """
+        Find the k docs most relevant to the query.
+        mode 'vector' ranks by embedding similarity only, 'lexical' by BM25 only,
+        'hybrid' answers from BM25 when the keyword match is confident and otherwise fuses both rankings
+        with reciprocal rank fusion.
+        """
+        return self.query_many([query], k, mode)[0]
+
+    def query_many(self, queries: list[str], k: int = 5, mode: str = FAQ_RETRIEVAL_MODE) -> list[list[dict]]:
+        """
+        Find the k docs most relevant to each query, see query().
+        The queries needing embeddings are embedded in one call and searched with one matrix product.
+        """
+        results, bm25_scores, pending = self._lexical_pass(queries, k, mode)
+        if pending:
+            embeds = self._embed_queries([queries[i] for i in pending])
+            self._vector_pass(embeds, results, bm25_scores, pending, k, mode)
+        return results
+
+    async def aquery(self, query: str, k: int = 5, mode: str = FAQ_RETRIEVAL_MODE) -> list[dict]:
+        """Async version of query()."""
+        return (await self.aquery_many([query], k, mode))[0]
+
+    async def aquery_many(self, queries: list[str], k: int = 5, mode: str = FAQ_RETRIEVAL_MODE) -> list[list[dict]]:
+        """Async version of query_many(), the embedding call is awaited."""
+        results, bm25_scores, pending = self._lexical_pass(queries, k, mode)
+        if pending:
+            embeds = await self._aembed_queries([queries[i] for i in pending])
+            self._vector_pass(embeds, results, bm25_scores, pending, k, mode)
+        return results
+
+    def _lexical_pass(self, queries: list[str], k: int, mode: str) -> tuple[list, dict, list]:
+        # answer the queries that BM25 settles, return the results, the BM25 scores and the queries left to embed
+        results = [None] * len(queries)
+        bm25_scores = {}
+        pending = []
+        for i, query in enumerate(queries):
+            if mode != "vector":
+                bm25_scores[i] = self._bm25.scores(query)
+                if mode == "lexical" or (mode == "hybrid" and self._lexical_confident(query, bm25_scores[i])):
+                    self.stats["lexical"] += 1
+                    results[i] = [
+                        {**self._docs[idx], "similarity": bm25_scores[i][idx], "retrieval": "lexical"}
+                        for idx in self._top_k(bm25_scores[i], k)
+                    ]
+                    continue
+            pending.append(i)
+        return results, bm25_scores, pending
+
+    def _vector_pass(self, embeds: np.ndarray, results: list, bm25_scores: dict, pending: list, k: int, mode: str):
+        # the most similar docs of each embedded query
+        # the fused ranking looks deeper into both rankings than k
+        depth = k if mode == "vector" else max(k, RRF_DEPTH)
+        scores, ids = self._index.search(embeds, depth)
+        for row, i in enumerate(pending):
+            hits = [(int(idx), float(score)) for idx, score in zip(ids[row], scores[row]) if idx >= 0]
+            if mode == "vector":
+                self.stats["vector"] += 1
+                # return k docs with highest similarity scores and the scores
+                results[i] = [{**self._docs[idx], "similarity": score, "retrieval": "vector"} for idx, score in hits]
+                continue
+
+            # reciprocal rank fusion: every ranking adds 1 / (RRF_K + rank) to the docs it returned
+            self.stats["fused"] += 1
+            fused = np.zeros(len(self._docs))
+            similarity = dict(hits)
+            fused[[idx for idx, _ in hits]] += 1.0 / (RRF_K + np.arange(1, len(hits) + 1))
+            lexical = [idx for idx in self._top_k(bm25_scores[i], depth) if bm25_scores[i][idx] > 0]
+            fused[lexical] += 1.0 / (RRF_K + np.arange(1, len(lexical) + 1))
+            results[i] = [
+                {**self._docs[idx], "similarity": similarity.get(int(idx), 0.0), "retrieval": "fused"}
+                for idx in self._top_k(fused, k) if fused[idx] > 0
+            ]
+
+# Create an instance on first use, the FAQ embeddings are loaded or computed then
+retriever = LazyResource("faq_retriever", lambda: VectorStoreRetriever.from_docs(load_faq_docs()))
+
+_reload_lock = threading.Lock()
+
+def reload_faq(path: str = digital_banking_FAQ) -> dict:
+    """
+    Re-read the FAQ, diff it with the live index section by section, and swap in a new retriever if anything changed.
+    Unchanged sections keep their persisted embeddings, only new or edited sections are embedded.
+    The swap replaces the retriever in one assignment: queries already running finish on the old one.
+    :param path: path of the FAQ markdown file
+    :return: number of added, removed and embedded sections, and whether the index was swapped
+    """
+    with _reload_lock:
+        docs = load_faq_docs(path)
+        current = retriever.get() if retriever.ready else None
+        old = Counter(section_hash(doc["page_content"]) for doc in current._docs) if current else Counter()
+        new = Counter(section_hash(doc["page_content"]) for doc in docs)
+        result = {"added": sum((new - old).values()), "removed": sum((old - new).values()), "embedded": 0,
+                  "swapped": False}
+        if current is not None and not result["added"] and not result["removed"]:
+            return result
+        new_retriever = VectorStoreRetriever.from_docs(docs, current._backend if current else None)
+        retriever.set(new_retriever)
+        result.update(embedded=new_retriever.embedded, swapped=True)
+        return result
+
+class FAQWatcher:
+    """
+    Background thread polling the FAQ file and reloading the index when the file changes,
+    so that FAQ edits go live without restarting the workers.
+    """
+    def __init__(self, path: str = digital_banking_FAQ, interval: float = FAQ_RELOAD_INTERVAL):
+        """
+        Initialize the watcher
+        :param path: path of the FAQ markdown file
+        :param interval: seconds between two checks of the file
+        """
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._signature = self._stat()
+        self.reloads = 0
+        self.errors = 0
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_mtime_ns, st.st_size
+        except OSError:
+            return None
+
+    def check(self) -> dict | None:
+        """
+        Reload the FAQ if the file changed since the last check.
+        :return: the result of reload_faq(), None if the file didn't change
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        result = reload_faq(self.path)
+        self.reloads += 1
+        print(f"FAQ reloaded: {result}")
+        return result
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                # keep serving the previous index, the next change is tried again
+                self.errors += 1
+                print(f"FAQ reload failed: {type(e).__name__}: {e}")
+
+    def start(self):
+        """Start polling in a daemon thread."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="faq-watcher", daemon=True)
+            self._thread.start()
 
-# Create an instance
-retriever = VectorStoreRetriever.from_docs(docs)
+    def stop(self):
+        """Stop polling."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+def start_faq_watcher(interval: float = FAQ_RELOAD_INTERVAL) -> FAQWatcher | None:
+    """
+    Start watching the FAQ file for changes.
+    :param interval: seconds between two checks, 0 disables the watcher
+    :return: the running watcher, None if disabled
+    """
+    if interval <= 0:
+        return None
+    watcher = FAQWatcher(interval=interval)
+    watcher.start()
+    return watcher
 
 # Create a tool function, for searching arline policies
 @tool
@@ -57,6 +282,28 @@ def lookup_digital_banking_faq(query: str) -> str:
     # return the docs
     return "\n\n".join([doc["page_content"] for doc in docs])
 
+@async_implementation(lookup_digital_banking_faq)
+async def alookup_digital_banking_faq(query: str) -> str:
+    docs = await retriever.aquery(query, k=3)
+    return "\n\n".join([doc["page_content"] for doc in docs])
+
+def rebuild_faq_index(backend_name: str = FAQ_EMBEDDING_BACKEND) -> VectorStoreRetriever:
+    """
+    Re-embed all FAQ sections with a backend, discarding its persisted embeddings,
+    and make the new index live when it is the configured backend.
+    :param backend_name: 'openai' or 'local'
+    :return: the rebuilt retriever
+    """
+    backend = create_embedding_backend(backend_name)
+    npy_path = faq_embeddings_path(backend)
+    for path in (npy_path, os.path.splitext(npy_path)[0] + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+    new_retriever = VectorStoreRetriever.from_docs(load_faq_docs(), backend)
+    if backend_name == FAQ_EMBEDDING_BACKEND:
+        retriever.set(new_retriever)
+    return new_retriever
+
 # # testing
 # if __name__ == '__main__':
 #     print(lookup_digital_banking_faq.invoke('When should I contact my RM?'))
@@ -17,4 +17,77 @@ TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
 # database
 banking_data_excel = f"{basic_dir}/database/banking_data.xlsx"
 banking_data_db = f"{basic_dir}/database/banking_data.db"
-digital_banking_FAQ = f'{basic_dir}/database/digital_banking_FAQ.md'
\ No newline at end of file
+digital_banking_FAQ = f'{basic_dir}/database/digital_banking_FAQ.md'
+FAQ_EMBEDDING_BACKEND = os.getenv("FAQ_EMBEDDING_BACKEND", "openai")  # 'openai' (API) or 'local' (hashed TF-IDF, offline)
+FAQ_LOCAL_EMBEDDING_DIM = int(os.getenv("FAQ_LOCAL_EMBEDDING_DIM", 4096))  # hashed dimensions of the local backend
+# persisted FAQ embeddings, one file per backend, manifest next to it as .json
+FAQ_EMBEDDINGS = os.getenv("FAQ_EMBEDDINGS", f"{basic_dir}/database/digital_banking_FAQ.{{backend}}.embeddings.npy")
+FAQ_QUERY_CACHE_SIZE = int(os.getenv("FAQ_QUERY_CACHE_SIZE", 1024))  # max cached query embeddings
+FAQ_QUERY_CACHE_PATH = os.getenv("FAQ_QUERY_CACHE_PATH", "")  # .npz file to persist the query embeddings, empty to keep them in memory
+FAQ_RELOAD_INTERVAL = float(os.getenv("FAQ_RELOAD_INTERVAL", 5))  # seconds between checks of the FAQ file for edits, 0 disables
+FAQ_RETRIEVAL_MODE = os.getenv("FAQ_RETRIEVAL_MODE", "hybrid")  # 'hybrid', 'vector' or 'lexical'
+BM25_MIN_COVERAGE = float(os.getenv("BM25_MIN_COVERAGE", 0.75))  # share of query terms the best section must hold to skip embeddings
+BM25_MIN_MARGIN = float(os.getenv("BM25_MIN_MARGIN", 1.25))  # min ratio of the best BM25 score to the runner-up to skip embeddings
+RRF_K = int(os.getenv("RRF_K", 60))  # rank offset of reciprocal rank fusion
+RRF_DEPTH = int(os.getenv("RRF_DEPTH", 50))  # docs taken from each ranking for the fusion
+FAQ_VECTOR_DIM = int(os.getenv("FAQ_VECTOR_DIM", 0))  # keep only the first dimensions of the embeddings, 0 keeps all
+FAQ_VECTOR_INDEX = os.getenv("FAQ_VECTOR_INDEX", "auto")  # 'flat' (exact), 'ivf' (approximate), 'auto' (ivf for large corpora)
+FAQ_ANN_MIN_ROWS = int(os.getenv("FAQ_ANN_MIN_ROWS", 5000))  # corpus size from which 'auto' uses the ivf index
+FAQ_ANN_PROBES = int(os.getenv("FAQ_ANN_PROBES", 8))  # clusters scanned per query by the ivf index
+
+# database connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 4))  # max idle connections kept per pool
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", 64 * 1024 * 1024))  # bytes memory-mapped by read-only connections
+DB_BUSY_TIMEOUT = float(os.getenv("DB_BUSY_TIMEOUT", 30))  # seconds to wait for a locked database
+
+
+# stock quote cache
+QUOTE_CACHE_TTL = float(os.getenv("QUOTE_CACHE_TTL", 60))  # seconds a quote stays fresh
+QUOTE_CACHE_SIZE = int(os.getenv("QUOTE_CACHE_SIZE", 256))  # max cached quotes
+QUOTE_FETCH_WORKERS = int(os.getenv("QUOTE_FETCH_WORKERS", 8))  # max quotes fetched concurrently by check_earnings
+QUOTE_FETCH_TIMEOUT = float(os.getenv("QUOTE_FETCH_TIMEOUT", 30))  # seconds allowed for a single quote
+
+# market data
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "tavily")  # 'tavily' (live search + LLM) or 'fixture' (offline)
+MARKET_DATA_FIXTURE = os.getenv("MARKET_DATA_FIXTURE", f"{basic_dir}/database/market_data_fixture.json")
+
+# securities master
+SECURITIES_SEED = os.getenv("SECURITIES_SEED", f"{basic_dir}/database/securities_master.json")
+SECURITY_MATCH_CUTOFF = float(os.getenv("SECURITY_MATCH_CUTOFF", 0.85))  # difflib similarity for fuzzy name matches
+SECURITY_MATCH_MIN_LENGTH = int(os.getenv("SECURITY_MATCH_MIN_LENGTH", 5))  # shorter names and aliases only match exactly
+SECURITY_MATCH_MARGIN = float(os.getenv("SECURITY_MATCH_MARGIN", 0.05))  # similarity lead over another security needed for a fuzzy match
+
+# assistant context window
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", 8000))  # prompt budget of an assistant call, 0 sends the whole conversation
+CONTEXT_FOLD_RATIO = float(os.getenv("CONTEXT_FOLD_RATIO", 0.6))  # share of the budget left to recent turns after older ones are summarized
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", 300))  # length of the rolling summary
+
+# intent router in front of the primary assistant
+INTENT_ROUTER = os.getenv("INTENT_ROUTER", "1") == "1"  # hand confident requests to the specialist without the primary assistant's LLM
+INTENT_EXAMPLES = os.getenv("INTENT_EXAMPLES", f"{basic_dir}/database/intent_examples.json")  # labeled utterances of the router
+INTENT_MIN_SIMILARITY = float(os.getenv("INTENT_MIN_SIMILARITY", 0.2))  # similarity of the closest example needed to route locally
+INTENT_MIN_MARGIN = float(os.getenv("INTENT_MIN_MARGIN", 0.05))  # gap to the closest example of another assistant needed to route locally
+
+# assistant retries on empty model responses
+ASSISTANT_MAX_ATTEMPTS = int(os.getenv("ASSISTANT_MAX_ATTEMPTS", 3))  # LLM calls per assistant turn before the fallback reply
+ASSISTANT_RETRY_BACKOFF = float(os.getenv("ASSISTANT_RETRY_BACKOFF", 0.5))  # seconds before the first retry, doubled for every next one
+ASSISTANT_RETRY_MAX_BACKOFF = float(os.getenv("ASSISTANT_RETRY_MAX_BACKOFF", 4))  # max seconds between two retries
+ASSISTANT_DEADLINE = float(os.getenv("ASSISTANT_DEADLINE", 60))  # seconds an assistant may spend retrying, 0 for no deadline
+
+# conversation checkpoints
+CHECKPOINTER = os.getenv("CHECKPOINTER", "sqlite")  # 'sqlite' (persistent, with retention) or 'memory'
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", f"{basic_dir}/database/checkpoints.db")
+CHECKPOINT_KEEP_LATEST = int(os.getenv("CHECKPOINT_KEEP_LATEST", 20))  # checkpoints kept per conversation, 0 keeps all
+CHECKPOINT_THREAD_TTL = float(os.getenv("CHECKPOINT_THREAD_TTL", 7 * 24 * 3600))  # seconds before an idle conversation expires, 0 never
+CHECKPOINT_COMPACT_INTERVAL = float(os.getenv("CHECKPOINT_COMPACT_INTERVAL", 600))  # seconds between compactions, 0 disables
+
+# latency tracing of graph nodes, tools, LLM calls, database queries, embeddings and quotes
+TRACING = os.getenv("TRACING", "1") == "1"
+TRACE_SINKS = os.getenv("TRACE_SINKS", "histogram")  # comma-separated: 'histogram' (in-memory p50/p95/p99) and/or 'otel' (OpenTelemetry)
+TRACE_HISTOGRAM_SIZE = int(os.getenv("TRACE_HISTOGRAM_SIZE", 2048))  # latest durations kept per span name
+
+# chat UI
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 1024))  # client profiles cached per process
+DEFAULT_USER_ID = os.getenv("DEFAULT_USER_ID", "AB123")  # client of a new browser session
+CHAT_CONCURRENCY = int(os.getenv("CHAT_CONCURRENCY", 16))  # conversations the Gradio queue runs in parallel
+CHAT_ASYNC = os.getenv("CHAT_ASYNC", "1") == "1"  # run the graph on the event loop, with async LLM, quote and FAQ calls
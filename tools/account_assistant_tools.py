@@ -1,8 +1,18 @@
 from datetime import datetime
-import pandas as pd
 from langchain_core.tools import tool
-from sqlite3 import connect
-from tools import banking_data_db
+from tools.db_connection import read_connection, write_connection
+from tools.db_schema import SAVINGS_COLUMNS
+from tools.resources import lazy_module
+
+# pandas is imported on the first query that needs it, not at startup
+pd = lazy_module("pandas")
+
+# User's saving account and its latest balance, a primary-key lookup in the balance snapshot
+saving_balance_query = """
+    SELECT u.saving_account, b.balance
+    FROM user u LEFT JOIN account_balances b ON b.account_id = u.saving_account
+    WHERE u.user_id = ?
+"""
 
 # TODO: Tool to check the balance of the user's saving account
 @tool
@@ -15,26 +25,18 @@ def check_saving_account_balance(user_id: str):
     Returns:
         the balance of saving account from this user id
     """
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        conn.close()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(saving_balance_query, (user_id,))
+        row = cursor.fetchone()
         cursor.close()
+    if row is None:
         return "No user found with this ID."
-    saving_account = row[0]
+    saving_account, balance = row
     if saving_account is None:
-        conn.close()
-        cursor.close()
         return "The user has no saving account with the bank."
 
-    query = f"SELECT balance FROM {saving_account} where date = (SELECT MAX(date) FROM {saving_account})"
-    cursor.execute(query)
-    result = cursor.fetchone()
-    cursor.close()
-    conn.close()
-    return f"Your saving account balance is {result[0]}."
+    return f"Your saving account balance is {balance or 0.0}."
 
 # TODO: Tool to check the transaction history of the user's saving account
 @tool
@@ -49,25 +51,21 @@ def check_account_history(user_id: str, start_date: str, end_date: str):
     Returns:
         a summary transaction history from this user id
     """
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        cursor.close()
-        conn.close()
-        return "No user found with this ID."
-    saving_account = row[0]
-    if saving_account is None:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
         cursor.close()
-        conn.close()
-        return "The user has no saving account with the bank."
+        if row is None:
+            return "No user found with this ID."
+        saving_account = row[0]
+        if saving_account is None:
+            return "The user has no saving account with the bank."
 
-    # Extract the data in the queried period.
-    query = f"""SELECT * FROM {saving_account} WHERE date >= ? AND date < date(?, '+1 day') ORDER BY date"""
-    df_all = pd.read_sql_query(query, conn, params=(start_date, end_date)).sort_values("date").reset_index(drop=True)  # Sort trades by date (safety)
-    cursor.close()
-    conn.close()
+        # Extract the data in the queried period.
+        query = f"""SELECT {", ".join(SAVINGS_COLUMNS)} FROM savings_transactions
+                    WHERE account_id = ? AND date >= ? AND date < date(?, '+1 day') ORDER BY date, transaction_id"""
+        df_all = pd.read_sql_query(query, conn, params=(saving_account, start_date, end_date)).sort_values("date").reset_index(drop=True)  # Sort trades by date (safety)
 
     if df_all.empty:
         return "No transactions found within the specified date range."
@@ -147,27 +145,22 @@ def check_pending_transfer(user_id: str):
         Information about user's pending transfers.
     """
     # Have the user's saving account first.
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        conn.close()
-        cursor.close()
-        return "No user found with this ID."
-    saving_account = row[0]
-    if saving_account is None:
-        conn.close()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
         cursor.close()
-        return "The user has no saving account with the bank."
-
-    # Have the pending transfers
-    query = "SELECT * FROM pending_transfers WHERE sender_account = ?"
-    df_transfers = pd.read_sql_query(query, conn, params=(saving_account,)).sort_values(
-        "transfer_date").reset_index(drop=True)
+        if row is None:
+            return "No user found with this ID."
+        saving_account = row[0]
+        if saving_account is None:
+            return "The user has no saving account with the bank."
+
+        # Have the pending transfers
+        query = "SELECT * FROM pending_transfers WHERE sender_account = ?"
+        df_transfers = pd.read_sql_query(query, conn, params=(saving_account,)).sort_values(
+            "transfer_date").reset_index(drop=True)
     dict_transfers = df_transfers.to_dict(orient="records")
-    cursor.close()
-    conn.close()
 
     if len(dict_transfers) == 0:
         return "The user has no pending transfers."
@@ -204,73 +197,56 @@ def transfer_fund(user_id: str, amount: float, recipient_account: str, recipient
         The status of the transfer, and an update to the database if the transfer is successfully submitted.
     """
     # Gey the user's saving account first.
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT saving_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        conn.close()
-        cursor.close()
-        return "No user found with this ID."
-    saving_account = row[0]
-    if saving_account is None:
-        conn.close()
-        cursor.close()
-        return "The user has no saving account with the bank."
-
-    # Check if the transfer date is valid.
-    try:
-        transfer_dt = datetime.strptime(transfer_date, "%Y-%m-%d").date()
-    except ValueError:
-        cursor.close()
-        conn.close()
-        return "The transfer date format is invalid. Please use 'YYYY-MM-DD'."
-    today = datetime.today().date()
-    if transfer_dt < today:
-        cursor.close()
-        conn.close()
-        return "Transfers can only be scheduled for today or a future date. Kindly update the transfer date to proceed."
-
-    # Check if the transfer amount is valid
-    if amount > 3000:
-        cursor.close()
-        conn.close()
-        return "The maximum allowable amount per transaction with the chatbot is $3,000. Please contact your relationship manager to adjust the limit or select other channel to submit the transfer."
-    if amount < 0:
-        cursor.close()
-        conn.close()
-        return "Please input an appropriate transfer amount."
-
-    # Check if the remaining balance (excluding today's pending transfers) is sufficient (only for today's transfer)
-    query = f"SELECT balance FROM {saving_account} where date = (SELECT MAX(date) FROM {saving_account})"
-    cursor.execute(query)
-    current_balance = cursor.fetchone()[0]
-
-    # Have the pending transfers
-    query = "SELECT * FROM pending_transfers WHERE sender_account = ?"
-    df_transfers = pd.read_sql_query(query, conn, params=(saving_account,)).sort_values("transfer_date").reset_index(
-        drop=True)
-    dict_transfers = df_transfers.to_dict(orient="records")
-
-    # Have today's sum of pending transfers
-    if len(dict_transfers) > 0:
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(saving_balance_query, (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return "No user found with this ID."
+        saving_account, current_balance = row
+        if saving_account is None:
+            return "The user has no saving account with the bank."
+
+        # Check if the transfer date is valid.
+        try:
+            transfer_dt = datetime.strptime(transfer_date, "%Y-%m-%d").date()
+        except ValueError:
+            return "The transfer date format is invalid. Please use 'YYYY-MM-DD'."
         today = datetime.today().date()
-        today_pending_transfer = sum(item["transfer_amount"]
-                                     for item in dict_transfers
-                                     if datetime.strptime(item['transfer_date'][:10], "%Y-%m-%d").date() == today)
-    else:
-        today_pending_transfer = 0
-    available_funds = current_balance - today_pending_transfer
-    if transfer_dt == today and amount > available_funds:
-        cursor.close()
-        conn.close()
-        return (
-            f"Insufficient funds: your saving account does not currently hold enough balance to complete this transfer.\n"
-            f"Available transferable amount today: ${available_funds:,.2f}.\n"
-            "Please ensure adequate funds are available before proceeding."
-        )
-    # The transfer is OK to proceed
-    else:
+        if transfer_dt < today:
+            return "Transfers can only be scheduled for today or a future date. Kindly update the transfer date to proceed."
+
+        # Check if the transfer amount is valid
+        if amount > 3000:
+            return "The maximum allowable amount per transaction with the chatbot is $3,000. Please contact your relationship manager to adjust the limit or select other channel to submit the transfer."
+        if amount < 0:
+            return "Please input an appropriate transfer amount."
+
+        # Check if the remaining balance (excluding today's pending transfers) is sufficient (only for today's transfer)
+        current_balance = current_balance or 0.0
+
+        # Have the pending transfers
+        query = "SELECT * FROM pending_transfers WHERE sender_account = ?"
+        df_transfers = pd.read_sql_query(query, conn, params=(saving_account,)).sort_values("transfer_date").reset_index(
+            drop=True)
+        dict_transfers = df_transfers.to_dict(orient="records")
+
+        # Have today's sum of pending transfers
+        if len(dict_transfers) > 0:
+            today = datetime.today().date()
+            today_pending_transfer = sum(item["transfer_amount"]
+                                         for item in dict_transfers
+                                         if datetime.strptime(item['transfer_date'][:10], "%Y-%m-%d").date() == today)
+        else:
+            today_pending_transfer = 0
+        available_funds = current_balance - today_pending_transfer
+        if transfer_dt == today and amount > available_funds:
+            return (
+                f"Insufficient funds: your saving account does not currently hold enough balance to complete this transfer.\n"
+                f"Available transferable amount today: ${available_funds:,.2f}.\n"
+                "Please ensure adequate funds are available before proceeding."
+            )
+        # The transfer is OK to proceed
         cursor.execute(
             """
             INSERT INTO pending_transfers (date, sender_account, transfer_amount, recipient_account, recipient_bank, transfer_date)
@@ -278,13 +254,11 @@ def transfer_fund(user_id: str, amount: float, recipient_account: str, recipient
             """,
             (today.strftime("%Y-%m-%d %H:%M:%S"), saving_account, amount, recipient_account, recipient_bank, transfer_dt.strftime("%Y-%m-%d %H:%M:%S"))
         )
-        conn.commit()
         cursor.close()
-        conn.close()
 
-        formatted_date = datetime.strptime(transfer_date, "%Y-%m-%d").strftime("%A, %B %d, %Y")
-        confirmation_message = f"Your transfer of ${amount:,.2f} to account {recipient_account} at {recipient_bank} has been successfully scheduled for {formatted_date}."
-        if transfer_dt > today:
-            confirmation_message += " Kindly ensure that sufficient funds are available in your account on the scheduled transfer date."
+    formatted_date = datetime.strptime(transfer_date, "%Y-%m-%d").strftime("%A, %B %d, %Y")
+    confirmation_message = f"Your transfer of ${amount:,.2f} to account {recipient_account} at {recipient_bank} has been successfully scheduled for {formatted_date}."
+    if transfer_dt > today:
+        confirmation_message += " Kindly ensure that sufficient funds are available in your account on the scheduled transfer date."
 
-        return confirmation_message
\ No newline at end of file
+    return confirmation_message
\ No newline at end of file
@@ -0,0 +1,81 @@
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+
+# Words too common in the FAQ questions to tell sections apart
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i if in is it my of on or the there this to what when where "
+    "which who why will with you your me get".split()
+)
+
+def tokenize(text: str) -> list[str]:
+    """
+    Split a text into lower-case word tokens, without stopwords.
+    :param text: the text
+    :return: the tokens, in order
+    """
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index of the documents, scored with NumPy.
+    The heading of a document (its first line, the "###" question of a FAQ section) is counted heading_weight times,
+    so a query sharing the words of a question ranks that section first.
+    """
+    def __init__(self, texts: list[str], k1: float = 1.5, b: float = 0.75, heading_weight: int = 3):
+        """
+        Build the index
+        :param texts: the documents
+        :param k1: term frequency saturation
+        :param b: document length normalization
+        :param heading_weight: number of times the heading tokens are counted
+        """
+        self.k1 = k1
+        self.b = b
+        self.n_docs = len(texts)
+        self.doc_tokens = []
+        postings = defaultdict(list)
+        lengths = np.zeros(self.n_docs)
+        for doc_id, text in enumerate(texts):
+            heading, _, body = text.strip().partition("\n")
+            tokens = tokenize(heading) * heading_weight + tokenize(body)
+            self.doc_tokens.append(frozenset(tokens))
+            lengths[doc_id] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings[term].append((doc_id, tf))
+        avg_length = lengths.mean() if self.n_docs else 0.0
+        self._norm = self.k1 * (1 - self.b + self.b * lengths / avg_length) if avg_length else np.ones(self.n_docs)
+        # Term -> (doc ids, term frequencies, idf)
+        self._postings = {}
+        for term, entries in postings.items():
+            doc_ids, tfs = zip(*entries)
+            idf = math.log(1 + (self.n_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            self._postings[term] = (np.array(doc_ids), np.array(tfs, dtype=np.float64), idf)
+
+    def scores(self, query: str) -> np.ndarray:
+        """
+        Score all documents against a query.
+        :param query: the query text
+        :return: BM25 score of every document, 0 for documents sharing no term with the query
+        """
+        scores = np.zeros(self.n_docs)
+        for term in set(tokenize(query)):
+            entry = self._postings.get(term)
+            if entry is None:
+                continue
+            doc_ids, tfs, idf = entry
+            scores[doc_ids] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[doc_ids])
+        return scores
+
+    def coverage(self, query: str, doc_id: int) -> float:
+        """
+        Share of the query terms found in a document.
+        :param query: the query text
+        :param doc_id: index of the document
+        :return: between 0 and 1, 0 for a query without any indexable term
+        """
+        terms = set(tokenize(query))
+        if not terms:
+            return 0.0
+        return len(terms & self.doc_tokens[doc_id]) / len(terms)
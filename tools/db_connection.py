@@ -0,0 +1,121 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+from tools import banking_data_db, DB_POOL_SIZE, DB_MMAP_SIZE, DB_BUSY_TIMEOUT
+from tools.tracing import tracer
+
+class ConnectionPool:
+    """
+    A bounded pool of long-lived SQLite connections to one database file.
+    Connections are opened on demand, lent to one caller at a time and put back afterwards,
+    so the file open, schema parse and page-cache warm-up are paid once per connection instead of once per tool call.
+    """
+    def __init__(self, db_path: str, read_only: bool = False, max_size: int = DB_POOL_SIZE):
+        """
+        Initialize the pool
+        :param db_path: path of the SQLite database file
+        :param read_only: open connections with mode=ro and memory-mapped I/O, for the safe tools
+        :param max_size: max number of idle connections kept in the pool
+        """
+        self.db_path = str(db_path)
+        self.read_only = read_only
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self.hits = 0  # a pooled connection was reused
+        self.misses = 0  # a new connection had to be opened
+        self.discarded = 0  # a connection was closed because the pool was full
+
+    def _open(self) -> sqlite3.Connection:
+        """Open a new connection with the pragmas of this pool."""
+        if self.read_only:
+            uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle connection from the pool, or open a new one if none is idle."""
+        with self._lock:
+            if self._idle:
+                self.hits += 1
+                return self._idle.pop()
+            self.misses += 1
+        return self._open()
+
+    def release(self, conn: sqlite3.Connection):
+        """Give a connection back to the pool, close it if the pool is already full."""
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+            self.discarded += 1
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """
+        Lend a connection for the duration of the with-block.
+        On the write path the transaction is committed when the block succeeds and rolled back when it raises.
+        """
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close all idle connections, e.g. before the database file is rebuilt."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        """Return the counters of the pool."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "discarded": self.discarded,
+                "idle": len(self._idle),
+            }
+
+# Write path for transfer_fund, trade_stock and contact_rm, read path for the safe tools
+write_pool = ConnectionPool(banking_data_db)
+read_pool = ConnectionPool(banking_data_db, read_only=True)
+_wal_ready = threading.Event()
+
+@contextmanager
+def write_connection() -> Iterator[sqlite3.Connection]:
+    """Lend a pooled read-write connection to the banking database, the with-block is traced as a 'db' span."""
+    with tracer.span("db", "write"), write_pool.connection() as conn:
+        _wal_ready.set()
+        yield conn
+
+@contextmanager
+def read_connection() -> Iterator[sqlite3.Connection]:
+    """Lend a pooled read-only connection to the banking database, the with-block is traced as a 'db' span."""
+    if not _wal_ready.is_set():
+        # A read-only connection cannot switch the journal mode, so let the write path set up WAL first
+        with write_connection():
+            pass
+    with tracer.span("db", "read"), read_pool.connection() as conn:
+        yield conn
+
+def pool_stats() -> dict:
+    """Return the hit and miss counters of the read and write pools."""
+    return {"read": read_pool.stats(), "write": write_pool.stats()}
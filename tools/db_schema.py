@@ -0,0 +1,132 @@
+import sqlite3
+
+# Bump when the layout below changes, so that the bootstrap rebuilds existing databases
+SCHEMA_VERSION = 5
+
+# Columns of the ledgers, as they appear in the account sheets of banking_data.xlsx
+SAVINGS_COLUMNS = ["date", "description", "transaction_amount", "balance", "transaction_category"]
+TRADE_COLUMNS = ["date", "stock", "action", "unit_price", "volume", "trading_amount", "trading_fee", "total_amount",
+                 "cash_start", "cash_end"]
+
+# One table per ledger type, keyed by account id, instead of one table per account
+LEDGER_SCHEMA = """
+CREATE TABLE IF NOT EXISTS savings_transactions (
+    transaction_id INTEGER PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    date TIMESTAMP NOT NULL,
+    description TEXT,
+    transaction_amount REAL,
+    balance REAL,
+    transaction_category TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_savings_transactions_account_date
+    ON savings_transactions (account_id, date);
+
+CREATE TABLE IF NOT EXISTS trade_executions (
+    execution_id INTEGER PRIMARY KEY,
+    account_id TEXT NOT NULL,
+    date TIMESTAMP NOT NULL,
+    stock TEXT,
+    action TEXT,
+    unit_price REAL,
+    volume INTEGER,
+    trading_amount REAL,
+    trading_fee REAL,
+    total_amount REAL,
+    cash_start REAL,
+    cash_end REAL
+);
+CREATE INDEX IF NOT EXISTS idx_trade_executions_account_date
+    ON trade_executions (account_id, date);
+
+-- Latest balance of every account, rebuilt from the ledgers when the database is loaded
+-- (rebuild_account_balances). Nothing writes savings_transactions or trade_executions at runtime yet: a future ledger
+-- write must upsert the account's balance here in the same transaction as its insert, or the snapshot goes stale.
+CREATE TABLE IF NOT EXISTS account_balances (
+    account_id TEXT PRIMARY KEY,
+    account_type TEXT NOT NULL,
+    balance REAL NOT NULL,
+    as_of TIMESTAMP
+);
+
+-- Holdings of every trading account, with average cost basis and realized P&L, rebuilt from the trade ledger when the database is loaded
+-- (rebuild_positions). Nothing writes trade_executions at runtime yet: a future trade settlement must update the
+-- position of the stock in the same transaction as its trade_executions insert, or the snapshot goes stale.
+CREATE TABLE IF NOT EXISTS positions (
+    account_id TEXT NOT NULL,
+    stock TEXT NOT NULL,
+    shares INTEGER NOT NULL,
+    cost_basis REAL NOT NULL,
+    realized_earning REAL NOT NULL,
+    PRIMARY KEY (account_id, stock)
+);
+"""
+
+# Bookkeeping of the bootstrap: source fingerprint, date the data was rolled to and the applied offset
+METADATA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS db_metadata (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Securities master: canonical names with ticker and listing venue, and the normalized names resolving to them
+# Kept across rebuilds, so the entries learned from market data searches survive a reload of the Excel file
+SECURITIES_SCHEMA = """
+CREATE TABLE IF NOT EXISTS securities (
+    stock_name TEXT PRIMARY KEY,
+    ticker TEXT,
+    venue TEXT,
+    listed_us INTEGER NOT NULL,
+    source TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS security_aliases (
+    alias TEXT PRIMARY KEY,
+    stock_name TEXT NOT NULL REFERENCES securities (stock_name)
+);
+"""
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+    """Run the statements of a script one by one, executescript() would commit the open transaction first."""
+    for statement in script.split(";"):
+        if statement.strip():
+            conn.execute(statement)
+
+def create_ledger_schema(conn: sqlite3.Connection):
+    """
+    Create the ledger tables and their indexes if they don't exist yet.
+    Parameters:
+        conn (sqlite3.Connection): connection to the banking database
+    """
+    _execute_script(conn, LEDGER_SCHEMA)
+
+def create_metadata_schema(conn: sqlite3.Connection):
+    """
+    Create the metadata table of the bootstrap if it doesn't exist yet.
+    Parameters:
+        conn (sqlite3.Connection): connection to the banking database
+    """
+    _execute_script(conn, METADATA_SCHEMA)
+
+def create_securities_schema(conn: sqlite3.Connection):
+    """
+    Create the securities master tables if they don't exist yet.
+    Parameters:
+        conn (sqlite3.Connection): connection to the banking database
+    """
+    _execute_script(conn, SECURITIES_SCHEMA)
+
+def ledger_type(columns) -> str | None:
+    """
+    Tell which ledger an Excel sheet belongs to from its columns.
+    Parameters:
+        columns: the column names of the sheet
+    Returns:
+        str: 'savings', 'trade' or None if the sheet is not an account ledger
+    """
+    if list(columns) == SAVINGS_COLUMNS:
+        return "savings"
+    if list(columns) == TRADE_COLUMNS:
+        return "trade"
+    return None
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import math
+import zlib
+from abc import ABC, abstractmethod
+from collections import Counter
+import numpy as np
+from tools import OPENAI_API_KEY, FAQ_LOCAL_EMBEDDING_DIM
+from tools.bm25 import tokenize
+
+class EmbeddingBackend(ABC):
+    """
+    Turns FAQ sections and queries into vectors for VectorStoreRetriever.
+    """
+    name = "base"
+    remote = False  # whether embedding goes through a network call, worth caching per query
+
+    @property
+    @abstractmethod
+    def model_name(self) -> str:
+        """Identifies the vector space, persisted embeddings of another model name are not reused."""
+
+    def fit(self, texts: list[str]):
+        """
+        Adapt the backend to the document set before embedding it, a no-op for pretrained models.
+        :param texts: all documents of the index
+        """
+
+    @abstractmethod
+    def embed_documents(self, texts: list[str]) -> list:
+        """
+        Embed documents.
+        :param texts: the documents
+        :return: one vector per document
+        """
+
+    @abstractmethod
+    def embed_query(self, text: str) -> list:
+        """
+        Embed a query.
+        :param text: the query
+        :return: the query vector
+        """
+
+    async def aembed_documents(self, texts: list[str]) -> list:
+        """Async version of embed_documents(), run in a worker thread unless the backend has a native one."""
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> list:
+        """Async version of embed_query(), run in a worker thread unless the backend has a native one."""
+        return await asyncio.to_thread(self.embed_query, text)
+
+class OpenAIEmbeddingBackend(EmbeddingBackend):
+    """
+    OpenAI embeddings API, the client is created on first use.
+    """
+    name = "openai"
+    remote = True
+
+    def __init__(self):
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from langchain_openai import OpenAIEmbeddings
+            self._client = OpenAIEmbeddings(api_key = OPENAI_API_KEY)
+        return self._client
+
+    @property
+    def model_name(self) -> str:
+        return self.client.model
+
+    def embed_documents(self, texts: list[str]) -> list:
+        return self.client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list:
+        return self.client.embed_query(text)
+
+    async def aembed_documents(self, texts: list[str]) -> list:
+        return await self.client.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> list:
+        return await self.client.aembed_query(text)
+
+class HashedTfidfBackend(EmbeddingBackend):
+    """
+    Pure local TF-IDF embeddings: words, word bigrams and character trigrams hashed into a fixed number of dimensions,
+    weighted by sublinear term frequency and by the inverse document frequency over the FAQ, L2 normalized.
+    No network call and no model download, a query is embedded in microseconds.
+    """
+    name = "local"
+    remote = False
+
+    def __init__(self, n_features: int = FAQ_LOCAL_EMBEDDING_DIM, char_weight: float = 0.5):
+        """
+        Initialize the backend
+        :param n_features: number of hashed dimensions
+        :param char_weight: weight of the character trigrams relative to the words, they match "homescreen" with "home screen"
+        """
+        self.n_features = n_features
+        self.char_weight = char_weight
+        self._idf = np.ones(n_features)
+        self._idf_digest = "unfitted"
+
+    @property
+    def model_name(self) -> str:
+        return f"hashed-tfidf-{self.n_features}-{self._idf_digest}"
+
+    def _features(self, text: str) -> Counter:
+        """Weighted counts of the hashed features of a text, signed to cancel out collisions on average."""
+        tokens = tokenize(text)
+        grams = [(token, 1.0) for token in tokens]
+        grams += [(f"{a} {b}", 1.0) for a, b in zip(tokens, tokens[1:])]
+        for token in tokens:
+            padded = f"<{token}>"
+            grams += [(padded[i:i + 3], self.char_weight) for i in range(len(padded) - 2)]
+        features = Counter()
+        for gram, weight in grams:
+            h = zlib.crc32(gram.encode("utf8"))
+            features[h % self.n_features] += weight if (h >> 31) == 0 else -weight
+        return features
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.n_features)
+        for index, count in self._features(text).items():
+            vector[index] = math.copysign(1 + math.log(abs(count)), count) if count else 0.0
+        vector *= self._idf
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def fit(self, texts: list[str]):
+        df = np.zeros(self.n_features)
+        for text in texts:
+            df[list(self._features(text))] += 1
+        self._idf = np.log((1 + len(texts)) / (1 + df)) + 1
+        self._idf_digest = hashlib.sha256(self._idf.tobytes()).hexdigest()[:12]
+
+    def embed_documents(self, texts: list[str]) -> np.ndarray:
+        return np.array([self._vector(text) for text in texts]).reshape(len(texts), self.n_features)
+
+    def embed_query(self, text: str) -> np.ndarray:
+        return self._vector(text)
+
+# Backends selectable by FAQ_EMBEDDING_BACKEND
+BACKENDS = {
+    OpenAIEmbeddingBackend.name: OpenAIEmbeddingBackend,
+    HashedTfidfBackend.name: HashedTfidfBackend,
+}
+
+def create_embedding_backend(name: str) -> EmbeddingBackend:
+    """
+    Create an embedding backend by name.
+    :param name: 'openai' or 'local'
+    :return: the backend
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{name}', use one of {list(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,241 @@
+import atexit
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Callable
+import numpy as np
+from tools.tracing import tracer
+
+def section_hash(text: str) -> str:
+    """
+    Hash the content of a document section.
+    :param text: the section text
+    :return: sha256 hex digest of the text
+    """
+    return hashlib.sha256(text.encode("utf8")).hexdigest()
+
+def _atomic_write(path: str, write: Callable):
+    """Write a file through a temporary file in the same directory, so readers never see a partial file."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class EmbeddingStore:
+    """
+    Embedding matrix of a document set persisted as a .npy file, with a JSON manifest next to it
+    holding the embedding model name and the content hash of the section behind every row.
+    Sections whose hash is in the manifest are served from disk; only new or changed sections are embedded.
+    """
+    def __init__(self, npy_path: str, model_name: str):
+        """
+        Initialize the store
+        :param npy_path: path of the .npy file, the manifest is the same path with a .json suffix
+        :param model_name: embedding model name, a store written by another model is ignored
+        """
+        self.npy_path = str(npy_path)
+        self.manifest_path = os.path.splitext(self.npy_path)[0] + ".json"
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self.reused = 0  # sections served from disk
+        self.embedded = 0  # sections sent to the embedding model
+
+    def load(self) -> tuple[list, np.ndarray | None]:
+        """
+        Load the persisted matrix, memory-mapped.
+        :return: the section hashes of the rows and the matrix, ([], None) if missing, stale or written by another model
+        """
+        try:
+            with open(self.manifest_path, encoding="utf8") as f:
+                manifest = json.load(f)
+            if manifest.get("model") != self.model_name:
+                return [], None
+            matrix = np.load(self.npy_path, mmap_mode="r")
+            hashes = manifest["sections"]
+            if matrix.ndim != 2 or matrix.shape[0] != len(hashes):
+                return [], None
+        except (OSError, ValueError, KeyError):
+            return [], None
+        return hashes, matrix
+
+    def save(self, hashes: list, matrix: np.ndarray):
+        """
+        Persist the matrix and its manifest, each replaced atomically.
+        :param hashes: section hash of every row
+        :param matrix: the embedding matrix
+        """
+        _atomic_write(self.npy_path, lambda f: np.save(f, np.ascontiguousarray(matrix)))
+        manifest = {"model": self.model_name, "dimension": int(matrix.shape[1]), "sections": hashes}
+        _atomic_write(self.manifest_path, lambda f: f.write(json.dumps(manifest, indent=1).encode("utf8")))
+
+    def embed_documents(self, texts: list[str], embed: Callable[[list[str]], list]) -> np.ndarray:
+        """
+        Get the embedding matrix of the texts, embedding only the texts missing from the store.
+        :param texts: the document sections
+        :param embed: the embedding function of the model, e.g. OpenAIEmbeddings.embed_documents
+        :return: one row per text, memory-mapped from disk when nothing has changed
+        """
+        hashes = [section_hash(text) for text in texts]
+        with self._lock:
+            stored_hashes, stored = self.load()
+            if stored is not None and stored_hashes == hashes:
+                self.reused += len(texts)
+                return stored
+
+            rows = {h: i for i, h in enumerate(stored_hashes)}
+            missing = [i for i, h in enumerate(hashes) if h not in rows]
+            new_vectors = np.asarray(embed([texts[i] for i in missing])) if missing else None
+            dimension = new_vectors.shape[1] if new_vectors is not None else stored.shape[1]
+            matrix = np.empty((len(texts), dimension), dtype=np.float32)
+            for i, h in enumerate(hashes):
+                if h in rows:
+                    matrix[i] = stored[rows[h]]
+            if missing:
+                matrix[missing] = new_vectors
+            self.reused += len(texts) - len(missing)
+            self.embedded += len(missing)
+            self.save(hashes, matrix)
+            return matrix
+
+def normalize_query(query: str) -> str:
+    """
+    Normalize a query for cache lookups: lower case, single spaces, no surrounding punctuation.
+    :param query: the query text
+    :return: the normalized query
+    """
+    return " ".join(query.lower().split()).strip(" ?!.,;:")
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU cache of query embeddings keyed by the normalized query text,
+    so repeated questions skip the embedding round trip.
+    Optionally persisted to a .npz file, written every few new entries and at exit, and reloaded on start.
+    """
+    def __init__(self, model_name: str, max_size: int, path: str | None = None, persist_every: int = 16):
+        """
+        Initialize the cache
+        :param model_name: embedding model name, a persisted cache of another model is ignored
+        :param max_size: max number of cached queries, the least recently used one is evicted first
+        :param path: .npz file to persist the cache to, None or empty to keep it in memory only
+        :param persist_every: number of new entries between two writes of the file
+        """
+        self.model_name = model_name
+        self.max_size = max_size
+        self.path = path or None
+        self.persist_every = persist_every
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self._load()
+            atexit.register(self.save)
+
+    def _load(self):
+        """Read the persisted entries, ignored if missing, unreadable or written by another model."""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if str(data["model"]) != self.model_name:
+                    return
+                for query, vector in zip(data["queries"].tolist(), data["vectors"]):
+                    self._entries[query] = vector
+        except (OSError, ValueError, KeyError):
+            return
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def save(self):
+        """Persist the entries, in LRU order, if a path is set and there are unsaved entries."""
+        with self._lock:
+            if not self.path or not self._unsaved or not self._entries:
+                return
+            queries = np.array(list(self._entries), dtype=str)
+            vectors = np.stack(list(self._entries.values()))
+            self._unsaved = 0
+        _atomic_write(self.path, lambda f: np.savez(f, model=np.array(self.model_name), queries=queries, vectors=vectors))
+
+    def embed_queries(self, queries: list[str], embed_batch: Callable[[list[str]], list]) -> list[np.ndarray]:
+        """
+        Get the embeddings of several queries, the ones missing from the cache are embedded in one call.
+        :param queries: the query texts
+        :param embed_batch: the batch embedding function of the model, e.g. OpenAIEmbeddings.embed_documents
+        :return: one vector per query
+        """
+        keys, vectors, missing = self._lookup(queries)
+        if missing:
+            # Embed outside the lock, concurrent lookups of other queries are not blocked by the round trip
+            with tracer.span("embedding", "embed_queries", queries=len(missing)):
+                new_vectors = embed_batch([missing[key] for key in missing])
+            self._store(vectors, missing, new_vectors)
+        return [vectors[key] for key in keys]
+
+    async def aembed_queries(self, queries: list[str], aembed_batch: Callable) -> list[np.ndarray]:
+        """
+        Async version of embed_queries(), the event loop is free while the missing queries are embedded.
+        :param queries: the query texts
+        :param aembed_batch: the async batch embedding function of the model, e.g. OpenAIEmbeddings.aembed_documents
+        :return: one vector per query
+        """
+        keys, vectors, missing = self._lookup(queries)
+        if missing:
+            with tracer.span("embedding", "embed_queries", queries=len(missing)):
+                new_vectors = await aembed_batch([missing[key] for key in missing])
+            self._store(vectors, missing, new_vectors)
+        return [vectors[key] for key in keys]
+
+    def _lookup(self, queries: list[str]) -> tuple[list, dict, dict]:
+        """Cache keys of the queries, the cached vectors by key, and the first query text of every missing key."""
+        keys = [normalize_query(query) for query in queries]
+        vectors = {}
+        missing = {}
+        with self._lock:
+            for key, query in zip(keys, queries):
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    vectors[key] = vector
+                elif key not in missing:
+                    self.misses += 1
+                    missing[key] = query
+        return keys, vectors, missing
+
+    def _store(self, vectors: dict, missing: dict, new_vectors: list):
+        """Add the vectors embedded for the missing keys to the cache and to the vectors by key."""
+        for key, vector in zip(missing, new_vectors):
+            vector = np.asarray(vector)
+            vector.setflags(write=False)
+            vectors[key] = vector
+        with self._lock:
+            for key in missing:
+                self._entries[key] = vectors[key]
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._unsaved += len(missing)
+            persist = self.path is not None and self._unsaved >= self.persist_every
+        if persist:
+            self.save()
+
+    def stats(self) -> dict:
+        """Return the size of the cache and the hit and miss counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,35 +1,106 @@
-from datetime import datetime
-import pandas as pd
+from datetime import datetime, date
+import hashlib
+import json
 import sqlite3
 from pathlib import Path
+from tools import DB_BUSY_TIMEOUT, SECURITIES_SEED
+from tools.db_schema import SCHEMA_VERSION, create_ledger_schema, create_metadata_schema, create_securities_schema, ledger_type
+from tools.profile_cache import profile_cache
+from tools.ledger import rebuild_account_balances, rebuild_positions
+from tools.quote_cache import normalize_stock_name
+from tools.resources import lazy_module
 
-def create_db_update_date(excel_path: str, db_path: str):
+# pandas is only needed to rebuild from Excel, not for the daily roll forward
+pd = lazy_module("pandas")
+
+# Sheets whose dates are kept as they are in the Excel file
+UNSHIFTED_SHEETS = ["T8087423", "T9004281", "T3569016", "user", "pm"]
+
+# Date columns rolled forward every day, and the rows they are rolled for
+# The pending tables only roll the rows seeded from Excel
+ROLLED_COLUMNS = {
+    "savings_transactions": (["date"], None),
+    "account_balances": (["as_of"], "account_type = 'savings'"),
+    "pending_appointments": (["date", "appointment_date_time"], "seeded = 1"),
+    "pending_transfers": (["date", "transfer_date"], "seeded = 1"),
+    "pending_orders": (["date"], "seeded = 1"),
+}
+
+def fingerprint_source(excel_path: str, seed_path: str = SECURITIES_SEED) -> str:
     """
-    Create the database from excel and update the date of transactions to today's date
+    Fingerprint the Excel source and the securities seed together with the schema version.
     Parameters:
         excel_path (str): the path of the excel file
-        db_path (str): the pat of the database file
+        seed_path (str): the path of the securities master seed
+    Returns:
+        str: sha256 hex digest, changes whenever the file contents or the schema change
     """
-    # Load Excel file with all sheets
-    sheets = pd.read_excel(excel_path, sheet_name=None)  # Loads all sheets as dict
+    digest = hashlib.sha256(f"schema-v{SCHEMA_VERSION}".encode())
+    for path in (excel_path, seed_path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
 
-    # Get today's date
-    today = datetime.today().date()
+def _read_metadata(conn: sqlite3.Connection) -> dict:
+    """Read the bootstrap metadata, empty if the database was never bootstrapped."""
+    try:
+        return dict(conn.execute("SELECT key, value FROM db_metadata").fetchall())
+    except sqlite3.OperationalError:
+        return {}
+
+def _write_metadata(conn: sqlite3.Connection, **values):
+    """Upsert bootstrap metadata."""
+    conn.executemany(
+        "INSERT INTO db_metadata (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        [(key, str(value)) for key, value in values.items()]
+    )
+
+def _insert_rows(conn: sqlite3.Connection, table: str, df: "pd.DataFrame"):
+    """Insert a DataFrame into an existing table, in the current transaction (DataFrame.to_sql would commit it)."""
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].dt.strftime("%Y-%m-%d %H:%M:%S")
+    rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+    columns = ", ".join(f'"{column}"' for column in df.columns)
+    placeholders = ", ".join("?" for _ in df.columns)
+    conn.executemany(f'INSERT INTO "{table}" ({columns}) VALUES ({placeholders})', rows)
 
-    # Connect to SQLite (creates file if not exists)
-    conn = sqlite3.connect(db_path)
+def _replace_table(conn: sqlite3.Connection, table: str, df: "pd.DataFrame"):
+    """Recreate a table with the columns of a DataFrame and fill it."""
+    def sql_type(series: "pd.Series") -> str:
+        if pd.api.types.is_datetime64_any_dtype(series):
+            return "TIMESTAMP"
+        if pd.api.types.is_integer_dtype(series):
+            return "INTEGER"
+        if pd.api.types.is_float_dtype(series):
+            return "REAL"
+        return "TEXT"
+
+    conn.execute(f'DROP TABLE IF EXISTS "{table}"')
+    columns = ", ".join(f'"{column}" {sql_type(df[column])}' for column in df.columns)
+    conn.execute(f'CREATE TABLE "{table}" ({columns})')
+    _insert_rows(conn, table, df)
+
+def _load_sheets(conn: sqlite3.Connection, sheets: dict, today: date):
+    """
+    Rebuild all tables from the Excel sheets, with the dates of each sheet shifted so that its latest date becomes today.
+    The account sheets (S..., T...) go into the shared ledgers, the other sheets into a table of their own.
+    """
+    conn.execute("DROP TABLE IF EXISTS savings_transactions")
+    conn.execute("DROP TABLE IF EXISTS trade_executions")
+    conn.execute("DROP TABLE IF EXISTS account_balances")
+    conn.execute("DROP TABLE IF EXISTS positions")
+    create_ledger_schema(conn)
 
-    # Loop through each sheet and write to SQLite with date updated
     for sheet_name, df in sheets.items():
-        if sheet_name not in ["T8087423", "T9004281", "T3569016", "user", "pm"]:
+        if sheet_name not in UNSHIFTED_SHEETS:
             # Convert 'date' column to datetime
             df["date"] = pd.to_datetime(df["date"])
 
-            # Find the latest date in the sheet
-            max_date = df["date"].max().date()
-
             # Calculate offset to shift dates so latest becomes today
-            date_offset = today - max_date
+            date_offset = today - df["date"].max().date()
 
             # Apply offset to all dates
             df["date"] = df["date"] + pd.to_timedelta(date_offset.days, unit="D")
@@ -39,9 +110,119 @@ def create_db_update_date(excel_path: str, db_path: str):
             elif sheet_name == "pending_transfers":
                 df["transfer_date"] = df["transfer_date"] + pd.to_timedelta(date_offset.days, unit="D")
 
-        df.to_sql(sheet_name.lower(), conn, if_exists="replace", index=False)
+        ledger = ledger_type(df.columns)
+        if ledger is not None:
+            # Drop the per-account table left by older builds, the account now lives in the shared ledger
+            conn.execute(f'DROP TABLE IF EXISTS "{sheet_name}"')
+            table = "savings_transactions" if ledger == "savings" else "trade_executions"
+            df.insert(0, "account_id", sheet_name)
+            _insert_rows(conn, table, df)
+        else:
+            if sheet_name.lower() in ROLLED_COLUMNS:
+                # Mark the seeded rows, rows added later by the tools keep their dates when rolling forward
+                df["seeded"] = 1
+            _replace_table(conn, sheet_name.lower(), df)
+
+    rebuild_account_balances(conn)
+    rebuild_positions(conn)
+
+def _load_securities(conn: sqlite3.Connection, seed_path: str):
+    """
+    Upsert the securities master seed, the entries learned from market data searches are kept.
+    The seed file has a "securities" list of stock_name, ticker, venue, listed_us and aliases.
+    """
+    create_securities_schema(conn)
+    with open(seed_path, encoding="utf8") as f:
+        securities = json.load(f)["securities"]
+    for security in securities:
+        conn.execute(
+            """
+            INSERT INTO securities (stock_name, ticker, venue, listed_us, source) VALUES (?, ?, ?, ?, 'seed')
+            ON CONFLICT(stock_name) DO UPDATE SET
+                ticker = excluded.ticker, venue = excluded.venue, listed_us = excluded.listed_us, source = 'seed'
+            """,
+            (security["stock_name"], security.get("ticker"), security.get("venue"), int(security["listed_us"]))
+        )
+        names = [security["stock_name"], security.get("ticker")] + security.get("aliases", [])
+        conn.executemany(
+            """
+            INSERT INTO security_aliases (alias, stock_name) VALUES (?, ?)
+            ON CONFLICT(alias) DO UPDATE SET stock_name = excluded.stock_name
+            """,
+            [(normalize_stock_name(name), security["stock_name"]) for name in names if name]
+        )
+
+def _roll_dates(conn: sqlite3.Connection, days: int):
+    """Shift all rolled date columns by a number of days, in place."""
+    for table, (columns, condition) in ROLLED_COLUMNS.items():
+        assignments = ", ".join(f"{column} = datetime({column}, '{days:+d} days')" for column in columns)
+        conn.execute(f"UPDATE {table} SET {assignments}" + (f" WHERE {condition}" if condition else ""))
+
+def create_db_update_date(excel_path: str, db_path: str) -> str:
+    """
+    Create the database from excel and update the date of transactions to today's date.
+    The bootstrap is incremental and idempotent:
+    - the Excel file is only reloaded when its fingerprint differs from the one recorded in db_metadata,
+    - otherwise the dates are rolled forward to today with in-place UPDATEs in a single transaction,
+    - nothing is written when the database is already up to date.
+    The work is done under the database write lock and re-checked after acquiring it,
+    so concurrent workers starting together don't rebuild the file one after another.
+    Parameters:
+        excel_path (str): the path of the excel file
+        db_path (str): the pat of the database file
+    Returns:
+        str: 'rebuilt', 'rolled' or 'unchanged'
+    """
+    fingerprint = fingerprint_source(excel_path)
+    today = datetime.today().date()
+
+    # Connect to SQLite (creates file if not exists), transactions are managed explicitly
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    try:
+        conn.execute("PRAGMA journal_mode = WAL")
+        metadata = _read_metadata(conn)
+        if metadata.get("source_fingerprint") == fingerprint and metadata.get("rolled_to") == today.isoformat():
+            return "unchanged"
 
-    conn.close()
+        # Read Excel before taking the write lock, it is the slow part of a rebuild
+        sheets = None
+        if metadata.get("source_fingerprint") != fingerprint:
+            sheets = pd.read_excel(excel_path, sheet_name=None)  # Loads all sheets as dict
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            create_metadata_schema(conn)
+            # Another worker may have done the work while we were waiting for the lock
+            metadata = _read_metadata(conn)
+            if metadata.get("source_fingerprint") != fingerprint:
+                if sheets is None:
+                    sheets = pd.read_excel(excel_path, sheet_name=None)
+                _load_sheets(conn, sheets, today)
+                _load_securities(conn, SECURITIES_SEED)
+                _write_metadata(conn, source_fingerprint=fingerprint, rolled_to=today.isoformat(),
+                                date_offset_days=0)
+                status = "rebuilt"
+            elif metadata.get("rolled_to") != today.isoformat():
+                days = (today - date.fromisoformat(metadata["rolled_to"])).days
+                _roll_dates(conn, days)
+                _write_metadata(conn, rolled_to=today.isoformat(),
+                                date_offset_days=int(metadata.get("date_offset_days", 0)) + days)
+                status = "rolled"
+            else:
+                status = "unchanged"
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    finally:
+        conn.close()
+
+    if status == "rebuilt":
+        # the user and pm tables were reloaded, cached profiles may be outdated
+        profile_cache.invalidate()
+    return status
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
-create_db_update_date(PROJECT_ROOT/"database/banking_data.xlsx", PROJECT_ROOT/"database/banking_data.db")
\ No newline at end of file
+
+if __name__ == "__main__":
+    print(create_db_update_date(PROJECT_ROOT/"database/banking_data.xlsx", PROJECT_ROOT/"database/banking_data.db"))
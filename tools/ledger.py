@@ -0,0 +1,122 @@
+import sqlite3
+import numpy as np
+
+def rebuild_account_balances(conn: sqlite3.Connection):
+    """
+    Rebuild the whole balance snapshot from the ledgers, used after a bulk load.
+    Runs in the caller's transaction.
+    Parameters:
+        conn (sqlite3.Connection): connection to the banking database
+    """
+    conn.execute("DELETE FROM account_balances")
+    conn.execute(
+        """
+        INSERT INTO account_balances (account_id, account_type, balance, as_of)
+        SELECT account_id, 'savings', balance, date FROM (
+            SELECT account_id, balance, date,
+                   ROW_NUMBER() OVER (PARTITION BY account_id ORDER BY date DESC, transaction_id DESC) AS rn
+            FROM savings_transactions
+        ) WHERE rn = 1
+        """
+    )
+    conn.execute(
+        """
+        INSERT INTO account_balances (account_id, account_type, balance, as_of)
+        SELECT account_id, 'trading', cash_end, date FROM (
+            SELECT account_id, cash_end, date,
+                   ROW_NUMBER() OVER (PARTITION BY account_id ORDER BY date DESC, execution_id DESC) AS rn
+            FROM trade_executions
+        ) WHERE rn = 1
+        """
+    )
+
+def compute_positions(account_ids: np.ndarray, stocks: np.ndarray, volume: np.ndarray,
+                      total_amount: np.ndarray) -> list[tuple]:
+    """
+    Replay trades into positions with NumPy, without a Python loop over the trades, using the average cost method:
+    a buy adds its total amount (fee included) to the cost basis, a sell realizes
+    (net unit proceeds - average cost) * shares sold and reduces the cost basis at average cost.
+
+    Within a position, a sell multiplies the cost basis by r = shares_after / shares_before, and a buy adds to it.
+    With F the running product of r, the cost basis is C = F * cumsum(buy_amount / F).
+    F only becomes 0 when a position is fully sold, where the cost basis is reset anyway,
+    so the running products restart after every full liquidation ("segments").
+    Parameters:
+        account_ids (np.ndarray): account id of every trade
+        stocks (np.ndarray): stock of every trade, trades sorted by account, stock and then chronologically
+        volume (np.ndarray): volume of every trade, positive for a buy, negative for a sell
+        total_amount (np.ndarray): trading amount plus fee of every trade
+    Returns:
+        list[tuple]: (account_id, stock, shares, cost_basis, realized_earning) of every position
+    """
+    n = len(volume)
+    if n == 0:
+        return []
+    account_ids = np.asarray(account_ids, dtype=object)
+    stocks = np.asarray(stocks, dtype=object)
+    volume = np.asarray(volume, dtype=np.float64)
+    total_amount = np.asarray(total_amount, dtype=np.float64)
+    idx = np.arange(n)
+
+    def group_cumsum(values, start_idx):
+        """Inclusive cumulative sum restarting at every start index."""
+        total = np.cumsum(values)
+        return total - (total[start_idx] - values[start_idx])
+
+    # Position boundaries
+    group_start = np.r_[True, (account_ids[1:] != account_ids[:-1]) | (stocks[1:] != stocks[:-1])]
+    group_start_idx = np.maximum.accumulate(np.where(group_start, idx, 0))
+
+    # Shares held after and before each trade
+    shares_after = group_cumsum(volume, group_start_idx)
+    shares_before = shares_after - volume
+    is_buy = volume > 0
+    liquidated = ~is_buy & (shares_after == 0)
+
+    # Segments restart after every full liquidation
+    segment_start = group_start | np.r_[False, liquidated[:-1]]
+    segment_start_idx = np.maximum.accumulate(np.where(segment_start, idx, 0))
+
+    # Cost multiplier of each trade, 1 for buys, for sells without shares and for the liquidating sell itself
+    ratio = np.ones(n)
+    scaled = ~is_buy & (shares_before > 0) & ~liquidated
+    ratio[scaled] = shares_after[scaled] / shares_before[scaled]
+    log_abs = group_cumsum(np.log(np.abs(ratio)), segment_start_idx)
+    negatives = group_cumsum((ratio < 0).astype(np.float64), segment_start_idx)
+    factor = np.exp(log_abs) * np.where(negatives % 2 == 1, -1.0, 1.0)
+
+    # Cost basis after each trade
+    cost_basis = factor * group_cumsum(np.where(is_buy, total_amount / factor, 0.0), segment_start_idx)
+    cost_basis[liquidated] = 0.0
+
+    # Realized earning of each sell against the average cost before it
+    cost_before = np.where(segment_start, 0.0, np.r_[0.0, cost_basis[:-1]])
+    avg_cost = np.divide(cost_before, shares_before, out=np.zeros(n), where=shares_before > 0)
+    unit_proceeds = np.divide(total_amount, volume, out=np.zeros(n), where=volume != 0)
+    realized = np.where(is_buy, 0.0, (unit_proceeds - avg_cost) * -volume)
+    realized_total = group_cumsum(realized, group_start_idx)
+
+    # The last trade of every position holds its final state
+    group_end = np.r_[group_start[1:], True]
+    return [
+        (account_ids[i], stocks[i], int(shares_after[i]), float(cost_basis[i]), float(realized_total[i]))
+        for i in idx[group_end]
+    ]
+
+def rebuild_positions(conn: sqlite3.Connection):
+    """
+    Rebuild all positions from the trade ledger, used after a bulk load or backfill.
+    Runs in the caller's transaction.
+    Parameters:
+        conn (sqlite3.Connection): connection to the banking database
+    """
+    rows = conn.execute(
+        "SELECT account_id, stock, volume, total_amount FROM trade_executions ORDER BY account_id, stock, date, execution_id"
+    ).fetchall()
+    columns = list(zip(*rows)) if rows else [[], [], [], []]
+    positions = compute_positions(*columns)
+    conn.execute("DELETE FROM positions")
+    conn.executemany(
+        "INSERT INTO positions (account_id, stock, shares, cost_basis, realized_earning) VALUES (?, ?, ?, ?, ?)",
+        positions
+    )
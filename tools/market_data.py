@@ -0,0 +1,251 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+from pydantic import BaseModel, Field
+from tools import TAVILY_API_KEY, MARKET_DATA_PROVIDER, MARKET_DATA_FIXTURE
+from tools.quote_cache import normalize_stock_name
+from tools.resources import LazyResource
+
+# data class for structured output
+class stock_name_price(BaseModel):
+    """
+    Return the stock name and its current price.
+    """
+    stock_name : Optional[str] = Field(description = "the company name of the stock, not the ticker, not with '.com' or any appendix. English name only.")
+    stock_price: Optional[float] = Field(description="the current price of the stock")
+
+class MarketDataProvider(ABC):
+    """
+    Source of stock quotes and market summaries for the trading tools.
+    """
+    name = "base"
+
+    @abstractmethod
+    def get_quote(self, stock: str) -> stock_name_price:
+        """
+        Get the canonical name and current price of a stock, US stock market only.
+        :param stock: the stock/security/share name
+        :return: stock_name_price, with both fields None if the stock is not listed in the US stock market
+        """
+
+    @abstractmethod
+    def get_price(self, stock: str) -> stock_name_price:
+        """
+        Get the current price of a stock known to be listed in the US stock market, skipping the listing check.
+        :param stock: the canonical stock name
+        :return: stock_name_price
+        """
+
+    @abstractmethod
+    def search_stock(self, stock: str) -> str:
+        """
+        Summarize the current price and recent market analysis of a stock.
+        :param stock: the stock/security/share name
+        :return: the summary in the format "The stock price of XXX is XXX, and the analysis of the stock is XXXX."
+        """
+
+    # Async versions for the async graph path, by default the sync call runs in a worker thread
+    async def aget_quote(self, stock: str) -> stock_name_price:
+        return await asyncio.to_thread(self.get_quote, stock)
+
+    async def aget_price(self, stock: str) -> stock_name_price:
+        return await asyncio.to_thread(self.get_price, stock)
+
+    async def asearch_stock(self, stock: str) -> str:
+        return await asyncio.to_thread(self.search_stock, stock)
+
+class TavilyLLMProvider(MarketDataProvider):
+    """
+    Live market data: Tavily web search, with the LLM judging the listing and extracting name and price.
+    """
+    name = "tavily"
+
+    def __init__(self):
+        self._search_clients = {}
+        self._lock = threading.Lock()
+
+    def _search(self, max_results: int):
+        """Reuse one Tavily client per result size."""
+        with self._lock:
+            if max_results not in self._search_clients:
+                from langchain_tavily import TavilySearch
+                self._search_clients[max_results] = TavilySearch(max_results=max_results, api_key=TAVILY_API_KEY)
+            return self._search_clients[max_results]
+
+    @staticmethod
+    def _listed_prompt(response_listed: dict) -> str:
+        return (
+            f"This describes the listed market of a stock: {response_listed['results'][0]['content']}."
+            "If you think it is not listed in the US stock market, return the string of 'No'."
+            "Otherwise, return the string of 'Yes'."
+            "Only make judgement based on provided information, don't assume anything."
+            "Only return the result in string of 'Yes' or 'No'."
+        )
+
+    @staticmethod
+    def _price_chain():
+        from langchain_core.prompts import PromptTemplate
+        from graph.llm import llm
+        prompt_template = PromptTemplate.from_template(
+            'Here is the latest information of a stock price: {info}, '
+            'please extract the company English name as the stock name in string and the the stock price in float.'
+            'For the stock name, use the English company name, not the ticker, not with "Inc", ".com", "Corporation" or any appendix. Return English name only.'
+            'For example, use "Adobe", never use "Adobe Inc.", "Adobe.com" or "Adobe Corporation".'
+            'For the stock price, if there are multiple numbers mentioned, use the one with highest probability as the stoke price. Return one float only.'
+        )
+        runnable = llm.with_structured_output(stock_name_price)
+        return prompt_template | runnable
+
+    @staticmethod
+    def _search_prompt(stock: str, response: dict) -> str:
+        if response["results"]:
+            prompt_input = "\n\n".join([d["content"] for d in response["results"]])
+        return (
+            f"Here is the latest information of {stock} stock price: {prompt_input}, "
+            f"please summarize them in following format: The stock price of {stock} is XXX, and the analysis of the stock is XXXX."
+        )
+
+    def is_listed_us(self, stock: str) -> bool:
+        """
+        Check if the stock is listed in US stock market.
+        :param stock: the stock/security/share name
+        :return: False only when the LLM judges the search result as not listed in the US
+        """
+        from graph.llm import llm
+        query_listed = f"The stock market where {stock} is traded"
+        response_listed = self._search(1).run(query_listed)
+        result_listed = llm.invoke(self._listed_prompt(response_listed))
+        return result_listed.content != 'No'
+
+    def get_price(self, stock: str) -> stock_name_price:
+        """
+        Search the current price of a US listed stock and extract the canonical name and the price.
+        :param stock: the stock/security/share name
+        :return: stock_name_price
+        """
+        query_price = f"Check the current share price of {stock} in the US stock market."
+        response_price = self._search(1).run(query_price)
+        if response_price["results"][0]["content"]:
+            final_response = self._price_chain().invoke({'info':response_price["results"][0]["content"]})
+        return final_response
+
+    def get_quote(self, stock: str) -> stock_name_price:
+        # Formulate the output class
+        # Use the stock name from the search result for standardization
+        if not self.is_listed_us(stock):
+            return stock_name_price(stock_name = None, stock_price = None)
+        return self.get_price(stock)
+
+    def search_stock(self, stock: str) -> str:
+        from graph.llm import llm
+        query = f"Check the current stock price of {stock} and the most recent analysis articles on the stock price movement or the company news that affects the stock price."
+        response = self._search(3).run(query)
+        final_response = llm.invoke(self._search_prompt(stock, response))
+
+        return final_response.content
+
+    # Native async versions: the Tavily searches and LLM calls are awaited instead of holding a thread
+    async def ais_listed_us(self, stock: str) -> bool:
+        from graph.llm import llm
+        response_listed = await self._search(1).arun(f"The stock market where {stock} is traded")
+        result_listed = await llm.ainvoke(self._listed_prompt(response_listed))
+        return result_listed.content != 'No'
+
+    async def aget_price(self, stock: str) -> stock_name_price:
+        response_price = await self._search(1).arun(f"Check the current share price of {stock} in the US stock market.")
+        if response_price["results"][0]["content"]:
+            final_response = await self._price_chain().ainvoke({'info':response_price["results"][0]["content"]})
+        return final_response
+
+    async def aget_quote(self, stock: str) -> stock_name_price:
+        if not await self.ais_listed_us(stock):
+            return stock_name_price(stock_name = None, stock_price = None)
+        return await self.aget_price(stock)
+
+    async def asearch_stock(self, stock: str) -> str:
+        from graph.llm import llm
+        query = f"Check the current stock price of {stock} and the most recent analysis articles on the stock price movement or the company news that affects the stock price."
+        response = await self._search(3).arun(query)
+        final_response = await llm.ainvoke(self._search_prompt(stock, response))
+        return final_response.content
+
+class FixtureProvider(MarketDataProvider):
+    """
+    Offline market data with deterministic prices and listings from a local JSON file,
+    for running and load-testing the trading tools without network access.
+    """
+    name = "fixture"
+
+    def __init__(self, fixture_path: str = MARKET_DATA_FIXTURE):
+        """
+        Load the fixture file
+        :param fixture_path: JSON file with a "securities" list of stock_name, aliases, listed_us, price and analysis
+        """
+        with open(fixture_path, encoding="utf8") as f:
+            securities = json.load(f)["securities"]
+        self._securities = {}
+        for security in securities:
+            for alias in [security["stock_name"]] + security.get("aliases", []):
+                self._securities[normalize_stock_name(alias)] = security
+
+    def _lookup(self, stock: str) -> Optional[dict]:
+        return self._securities.get(normalize_stock_name(stock))
+
+    def get_quote(self, stock: str) -> stock_name_price:
+        security = self._lookup(stock)
+        if security is None or not security["listed_us"]:
+            return stock_name_price(stock_name = None, stock_price = None)
+        return stock_name_price(stock_name=security["stock_name"], stock_price=security["price"])
+
+    def get_price(self, stock: str) -> stock_name_price:
+        security = self._lookup(stock)
+        if security is None or security.get("price") is None:
+            return stock_name_price(stock_name = None, stock_price = None)
+        return stock_name_price(stock_name=security["stock_name"], stock_price=security["price"])
+
+    def search_stock(self, stock: str) -> str:
+        security = self._lookup(stock)
+        if security is None:
+            return f"No market information about {stock} is available."
+        if not security["listed_us"]:
+            return f"{security['stock_name']} is not listed in the US stock market. {security.get('analysis', '')}".strip()
+        return f"The stock price of {security['stock_name']} is ${security['price']:,.2f}, and the analysis of the stock is {security.get('analysis', 'not available')}"
+
+    # In-memory lookups, answered directly on the event loop
+    async def aget_quote(self, stock: str) -> stock_name_price:
+        return self.get_quote(stock)
+
+    async def aget_price(self, stock: str) -> stock_name_price:
+        return self.get_price(stock)
+
+    async def asearch_stock(self, stock: str) -> str:
+        return self.search_stock(stock)
+
+# Providers selectable by MARKET_DATA_PROVIDER
+PROVIDERS = {
+    TavilyLLMProvider.name: TavilyLLMProvider,
+    FixtureProvider.name: FixtureProvider,
+}
+
+def _create_provider() -> MarketDataProvider:
+    if MARKET_DATA_PROVIDER not in PROVIDERS:
+        raise ValueError(f"Unknown market data provider '{MARKET_DATA_PROVIDER}', use one of {list(PROVIDERS)}")
+    return PROVIDERS[MARKET_DATA_PROVIDER]()
+
+_provider = LazyResource("market_data_provider", _create_provider)
+
+def get_market_data_provider() -> MarketDataProvider:
+    """
+    Get the configured market data provider, created on first use.
+    :return: the provider instance shared by the process
+    """
+    return _provider.get()
+
+def set_market_data_provider(provider: MarketDataProvider):
+    """
+    Replace the provider of the process, e.g. with a FixtureProvider for an offline benchmark.
+    :param provider: the new provider
+    """
+    _provider.set(provider)
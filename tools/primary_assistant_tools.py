@@ -1,10 +1,12 @@
 from datetime import datetime, timedelta
-import pandas as pd
 from langchain_core.runnables import RunnableConfig
 from langchain_core.tools import tool
 from typing import List, Dict, Optional
-from sqlite3 import connect
-from tools import banking_data_db
+from tools.db_connection import read_connection, write_connection
+from tools.resources import lazy_module
+
+# pandas is imported on the first query that needs it, not at startup
+pd = lazy_module("pandas")
 
 @tool
 def fetch_user_information(config: RunnableConfig) -> List[Dict]:
@@ -22,9 +24,6 @@ def fetch_user_information(config: RunnableConfig) -> List[Dict]:
     if not user_id:
         raise ValueError("User id is required")
 
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-
     # SQL query to fetch user information
     query = """
         SELECT 
@@ -36,13 +35,13 @@ def fetch_user_information(config: RunnableConfig) -> List[Dict]:
         WHERE 
             u.user_id = ?
         """
-    cursor.execute(query, (user_id,))
-    rows = cursor.fetchall()
-    column_names = [column[0] for column in cursor.description]
-    results = [dict(zip(column_names, row)) for row in rows]
-
-    cursor.close()
-    conn.close()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, (user_id,))
+        rows = cursor.fetchall()
+        column_names = [column[0] for column in cursor.description]
+        results = [dict(zip(column_names, row)) for row in rows]
+        cursor.close()
 
     return results
 
@@ -58,15 +57,14 @@ def contact_rm(user_id: str, appointment_date_time: Optional[str] = None) -> str
         Information about user's existing appointments with their RM or the status of new appointment booking.
     """
     # Have the pending appointments first
-    conn = connect(banking_data_db)
     query = "SELECT * FROM pending_appointments WHERE user_id = ?"
-    df_appointments = pd.read_sql_query(query, conn, params=(user_id,)).sort_values(
-        "appointment_date_time").reset_index(drop=True)
+    with read_connection() as conn:
+        df_appointments = pd.read_sql_query(query, conn, params=(user_id,)).sort_values(
+            "appointment_date_time").reset_index(drop=True)
     dict_appointments = df_appointments.to_dict(orient="records")
 
     # If the user only wants to check the pending appointments
     if appointment_date_time is None:
-        conn.close()
         if len(dict_appointments) == 0:
             return "The user has no appointment with the relationship manager."
         else:
@@ -92,12 +90,10 @@ def contact_rm(user_id: str, appointment_date_time: Optional[str] = None) -> str
 
         # Check if appointment is in the past
         if time_diff.total_seconds() < 0:
-            conn.close()
             return "You cannot make an appointment in the past. Please select a future date that is at least one day later."
 
         # Check if appointment is less than one day away
         if time_diff < timedelta(days=1):
-            conn.close()
             return "The appointment time must be scheduled at least one day in advance. Please choose a later time."
 
         # Check conflicts with existing appointment
@@ -106,7 +102,6 @@ def contact_rm(user_id: str, appointment_date_time: Optional[str] = None) -> str
                 existing_app_datetime = datetime.strptime(item['appointment_date_time'], "%Y-%m-%d %H:%M:%S")
                 time_diff_existing = appointment_dt - existing_app_datetime
                 if abs(time_diff_existing) < timedelta(hours=2):
-                    conn.close()
                     return (
                         f"You already have an appointment with your relationship manager on "
                         f"{existing_app_datetime.strftime('%A, %B %d, %Y at %I:%M %p')}. "
@@ -114,15 +109,12 @@ def contact_rm(user_id: str, appointment_date_time: Optional[str] = None) -> str
                     )
 
         # The appointment is OK to schedule
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO pending_appointments (date, user_id, appointment_date_time)
-            VALUES (?, ?, ?)
-            """,
-            (today.strftime("%Y-%m-%d %H:%M:%S"), user_id, appointment_dt)
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        with write_connection() as conn:
+            conn.execute(
+                """
+                INSERT INTO pending_appointments (date, user_id, appointment_date_time)
+                VALUES (?, ?, ?)
+                """,
+                (today.strftime("%Y-%m-%d %H:%M:%S"), user_id, appointment_dt)
+            )
         return f"Your new appointment with your relationship manager is scheduled at {appointment_dt.strftime('%A, %B %d, %Y at %I:%M %p')}."
\ No newline at end of file
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable
+from tools import PROFILE_CACHE_SIZE
+
+def render_user_info(profile: list[dict]) -> str:
+    """
+    Render the client's profile for the assistants' prompts, one "field: value" line per column.
+    :param profile: rows returned by fetch_user_information
+    :return: the prompt fragment
+    """
+    return "\n".join(
+        "\n".join(f"{key}: {value}" for key, value in row.items()) for row in profile
+    ) or "No information found for this user."
+
+@dataclass(frozen=True)
+class CachedProfile:
+    """A client profile with its prompt fragment, and the cache generation it was loaded in."""
+    user_info: list
+    prompt: str
+    generation: int
+
+class ProfileCache:
+    """
+    Process-wide LRU cache of client profiles by user id, so a new conversation doesn't query the user and pm tables again.
+    invalidate() drops the changed profiles and bumps the generation:
+    conversations holding a profile of an older generation get it from the cache again, reloaded if it was dropped.
+    """
+    def __init__(self, max_size: int = PROFILE_CACHE_SIZE):
+        """
+        Initialize the cache
+        :param max_size: max number of profiles, the least recently used one is evicted first
+        """
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str, load: Callable[[], list]) -> CachedProfile:
+        """
+        Get the profile of a client, loading it on a miss.
+        :param user_id: the client
+        :param load: function querying the profile, e.g. fetch_user_information
+        :return: the profile and its prompt fragment
+        """
+        with self._lock:
+            profile = self._entries.get(user_id)
+            if profile is not None:
+                if profile.generation != self.generation:
+                    # not dropped by the invalidation, still valid in the new generation
+                    profile = replace(profile, generation=self.generation)
+                    self._entries[user_id] = profile
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return profile
+            self.misses += 1
+            generation = self.generation
+        user_info = load()
+        profile = CachedProfile(user_info=user_info, prompt=render_user_info(user_info), generation=generation)
+        with self._lock:
+            # a profile loaded while the cache was invalidated is returned but not kept
+            if generation == self.generation:
+                self._entries[user_id] = profile
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return profile
+
+    def invalidate(self, user_id: str | None = None):
+        """
+        Drop cached profiles after the profile data changed, e.g. the database was rebuilt from Excel.
+        :param user_id: the client whose profile changed, None for all clients
+        """
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+            self.generation += 1
+
+    def stats(self) -> dict:
+        """Return the size of the cache, the generation and the hit and miss counters."""
+        with self._lock:
+            return {"size": len(self._entries), "generation": self.generation, "hits": self.hits, "misses": self.misses}
+
+profile_cache = ProfileCache()
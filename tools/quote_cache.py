@@ -0,0 +1,119 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+from tools import QUOTE_CACHE_TTL, QUOTE_CACHE_SIZE
+
+# Company suffixes ignored when matching stock names, so "Adobe Inc." and "adobe" share one entry
+_SUFFIXES = re.compile(r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|holdings|group|com)\b")
+
+def normalize_stock_name(stock: str) -> str:
+    """
+    Normalize a stock name for cache lookups: lower case, no punctuation, no company suffix.
+    :param stock: the stock/security/share name
+    :return: the normalized name
+    """
+    name = re.sub(r"[^\w\s]", " ", stock.lower())
+    name = _SUFFIXES.sub(" ", name)
+    return " ".join(name.split()) or stock.strip().lower()
+
+@dataclass(frozen=True)
+class CachedQuote:
+    """A quote as returned by get_current_price, with the time it was fetched."""
+    listed: bool  # whether the stock is listed in the US stock market
+    stock_name: Optional[str]  # canonical name
+    stock_price: Optional[float]
+    fetched_at: float  # time.monotonic() of the fetch
+
+class QuoteCache:
+    """
+    Process-wide LRU cache of stock quotes with a time to live.
+    Entries are stored under the normalized requested name and the normalized canonical name.
+    """
+    def __init__(self, ttl: float = QUOTE_CACHE_TTL, max_size: int = QUOTE_CACHE_SIZE):
+        """
+        Initialize the cache
+        :param ttl: seconds a quote stays fresh
+        :param max_size: max number of entries, the least recently used one is evicted first
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # misses where an expired entry was found
+        self.evictions = 0
+        self.fetch_seconds = 0.0  # total upstream latency of the fetches stored in the cache
+        self.fetches = 0
+
+    def get(self, stock: str) -> Optional[CachedQuote]:
+        """
+        Get a fresh quote.
+        :param stock: the stock/security/share name
+        :return: the cached quote, None if missing or expired
+        """
+        key = normalize_stock_name(stock)
+        with self._lock:
+            quote = self._entries.get(key)
+            if quote is None:
+                self.misses += 1
+                return None
+            if time.monotonic() - quote.fetched_at > self.ttl:
+                del self._entries[key]
+                self.misses += 1
+                self.stale += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return quote
+
+    def put(self, stock: str, stock_name: Optional[str], stock_price: Optional[float],
+            fetch_seconds: float = 0.0) -> CachedQuote:
+        """
+        Store a fetched quote.
+        :param stock: the requested stock name
+        :param stock_name: canonical stock name, None if the stock is not listed in the US
+        :param stock_price: current price
+        :param fetch_seconds: upstream latency of the fetch, used to estimate the time saved by hits
+        :return: the cached quote
+        """
+        quote = CachedQuote(stock_name is not None, stock_name, stock_price, time.monotonic())
+        keys = {normalize_stock_name(stock)}
+        if stock_name:
+            keys.add(normalize_stock_name(stock_name))
+        with self._lock:
+            self.fetches += 1
+            self.fetch_seconds += fetch_seconds
+            for key in keys:
+                self._entries[key] = quote
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return quote
+
+    def clear(self):
+        """Drop all entries, the counters are kept."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Return hit, miss and staleness counters, and the upstream latency saved by the hits."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            avg_fetch = self.fetch_seconds / self.fetches if self.fetches else 0.0
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "avg_fetch_seconds": avg_fetch,
+                "saved_seconds": self.hits * avg_fetch,
+            }
+
+quote_cache = QuoteCache()
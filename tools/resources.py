@@ -0,0 +1,75 @@
+import importlib
+import threading
+import time
+from typing import Callable
+
+# Lazy resources of the process by name, in the order they were declared
+_resources = {}
+
+class LazyResource:
+    """
+    A heavy resource (client, index, module) created on first use instead of at import, once per process.
+    Attribute access is forwarded to the resource, so a LazyResource can stand in for the object itself.
+    """
+    def __init__(self, name: str, factory: Callable[[], object]):
+        """
+        Declare the resource
+        :param name: name used by warm_up()
+        :param factory: function creating the resource, called at most once
+        """
+        self.name = name
+        self._factory = factory
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+        self.init_seconds = None  # time taken by the factory
+        _resources[name] = self
+
+    def get(self):
+        """Return the resource, creating it on the first call."""
+        if not self._ready:
+            with self._lock:
+                if not self._ready:
+                    start = time.perf_counter()
+                    self._value = self._factory()
+                    self.init_seconds = time.perf_counter() - start
+                    self._ready = True
+        return self._value
+
+    def set(self, value):
+        """Replace the resource, e.g. with a rebuilt index."""
+        with self._lock:
+            self._value = value
+            self._ready = True
+
+    @property
+    def ready(self) -> bool:
+        return self._ready
+
+    def __getattr__(self, item):
+        return getattr(self.get(), item)
+
+def lazy_module(name: str) -> LazyResource:
+    """
+    Declare a module imported on first use, e.g. pandas, so that warm_up() can import it ahead of the first request.
+    :param name: the module name
+    :return: the resource, get() returns the module
+    """
+    return _resources.get(name) or LazyResource(name, lambda: importlib.import_module(name))
+
+def warm_up(names: list[str] | None = None) -> dict:
+    """
+    Create lazy resources ahead of the first request, e.g. right before the app starts serving.
+    A resource failing to initialize (no network, no API key) is reported and left for its first use.
+    :param names: the resources to create, all declared resources if None
+    :return: seconds taken by every resource, or the error message if it failed
+    """
+    timings = {}
+    for name in names or list(_resources):
+        resource = _resources[name]
+        try:
+            resource.get()
+            timings[name] = resource.init_seconds
+        except Exception as e:
+            timings[name] = f"{type(e).__name__}: {e}"
+    return timings
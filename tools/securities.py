@@ -0,0 +1,171 @@
+import difflib
+import sqlite3
+import threading
+from dataclasses import dataclass
+from typing import Optional
+from tools import SECURITY_MATCH_CUTOFF, SECURITY_MATCH_MIN_LENGTH, SECURITY_MATCH_MARGIN
+from tools.db_connection import read_connection, write_connection
+from tools.market_data import stock_name_price
+from tools.quote_cache import normalize_stock_name
+
+@dataclass(frozen=True)
+class Security:
+    """An entry of the securities master."""
+    stock_name: str  # canonical name, e.g. "Adobe", never "Adobe Inc."
+    ticker: Optional[str]
+    venue: Optional[str]  # listing venue, e.g. NASDAQ, NYSE, SSE
+    listed_us: bool
+
+# All names resolving to a security, with the security.
+# Unlisted names learned from a search by older builds are skipped, so the provider is asked again
+_aliases_query = """
+    SELECT a.alias, s.stock_name, s.ticker, s.venue, s.listed_us
+    FROM security_aliases a JOIN securities s ON s.stock_name = a.stock_name
+    WHERE s.listed_us = 1 OR s.source != 'search'
+"""
+
+class SecuritiesMaster:
+    """
+    Local index of securities by normalized name, alias and ticker, backed by the securities tables.
+    Known securities resolve in memory without any network call; listed names found by the market data provider
+    are written back to the database so they resolve locally next time, also in other processes after a restart.
+    """
+    def __init__(self, match_cutoff: float = SECURITY_MATCH_CUTOFF, min_length: int = SECURITY_MATCH_MIN_LENGTH,
+                 match_margin: float = SECURITY_MATCH_MARGIN):
+        """
+        Initialize the index, the tables are read on first use
+        :param match_cutoff: min difflib similarity of a fuzzy match, 1.0 disables fuzzy matching
+        :param min_length: min length of a normalized name or alias to take part in fuzzy matching
+        :param match_margin: min similarity lead of the best security over the second best one for a fuzzy match
+        """
+        self.match_cutoff = match_cutoff
+        self.min_length = min_length
+        self.match_margin = match_margin
+        self._aliases = None
+        self._lock = threading.Lock()
+        self.hits = 0  # exact matches of a normalized name, alias or ticker
+        self.fuzzy_hits = 0
+        self.misses = 0
+        self.learned = 0  # names written back from the market data provider
+
+    def _load(self) -> dict:
+        """Read all aliases from the database, empty if the database was not bootstrapped with the securities yet."""
+        try:
+            with read_connection() as conn:
+                rows = conn.execute(_aliases_query).fetchall()
+        except sqlite3.OperationalError:
+            rows = []
+        return {
+            alias: Security(stock_name, ticker, venue, bool(listed_us))
+            for alias, stock_name, ticker, venue, listed_us in rows
+        }
+
+    def _fuzzy_match(self, key: str) -> Optional[Security]:
+        """
+        Find the security of a misspelled name among the names and aliases of at least min_length characters, never the tickers.
+        :param key: the normalized name, missing from the index
+        :return: the closest security, None if none is close enough or another security is almost as close
+        """
+        if len(key) < self.min_length:
+            return None
+        floor = self.match_cutoff - self.match_margin  # close enough to make the best match ambiguous
+        matcher = difflib.SequenceMatcher(b=key)
+        scores = {}  # canonical name -> (best similarity of its aliases, security)
+        for alias, security in self._aliases.items():
+            if len(alias) < self.min_length or (security.ticker and alias == normalize_stock_name(security.ticker)):
+                continue
+            matcher.set_seq1(alias)
+            if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                continue
+            score = matcher.ratio()
+            if score >= floor and score > scores.get(security.stock_name, (0.0, None))[0]:
+                scores[security.stock_name] = (score, security)
+        ranked = sorted(scores.values(), key=lambda item: item[0], reverse=True)
+        if not ranked or ranked[0][0] < self.match_cutoff:
+            return None
+        if len(ranked) > 1 and ranked[0][0] - ranked[1][0] < self.match_margin:
+            return None
+        return ranked[0][1]
+
+    def resolve(self, stock: str) -> Optional[Security]:
+        """
+        Find a security by name, alias or ticker, with a fuzzy match on the longer names as a fallback.
+        Fuzzy matches are not remembered as aliases, only exact spellings are.
+        :param stock: the stock/security/share name
+        :return: the security, None if the name is unknown
+        """
+        key = normalize_stock_name(stock)
+        with self._lock:
+            if self._aliases is None:
+                self._aliases = self._load()
+            security = self._aliases.get(key)
+            if security is not None:
+                self.hits += 1
+                return security
+            security = self._fuzzy_match(key)
+            if security is not None:
+                self.fuzzy_hits += 1
+                return security
+            self.misses += 1
+            return None
+
+    def learn(self, stock: str, quote: stock_name_price) -> Optional[Security]:
+        """
+        Write back the canonical name found by the market data provider for an unknown name.
+        Only a listed stock is learned: a quote without a name may be a wrong "not listed" answer of the listing check
+        or a failed price extraction, so the provider is asked again next time.
+        :param stock: the requested stock name
+        :param quote: the quote of the provider, with both fields None if the stock is not listed in the US
+        :return: the security the name now resolves to, None if nothing was learned
+        """
+        if quote.stock_name is None:
+            return None
+        stock_name = quote.stock_name
+        aliases = {normalize_stock_name(stock), normalize_stock_name(stock_name)}
+        security = Security(stock_name, None, None, True)
+        try:
+            with write_connection() as conn:
+                # A known canonical name keeps its entry, only the new spelling is added
+                conn.execute(
+                    "INSERT INTO securities (stock_name, ticker, venue, listed_us, source) VALUES (?, NULL, NULL, 1, 'search') "
+                    "ON CONFLICT(stock_name) DO NOTHING",
+                    (stock_name,)
+                )
+                conn.executemany(
+                    "INSERT INTO security_aliases (alias, stock_name) VALUES (?, ?) ON CONFLICT(alias) DO NOTHING",
+                    [(alias, stock_name) for alias in aliases]
+                )
+                row = conn.execute(
+                    "SELECT stock_name, ticker, venue, listed_us FROM securities WHERE stock_name = ?", (stock_name,)
+                ).fetchone()
+                security = Security(row[0], row[1], row[2], bool(row[3]))
+        except sqlite3.Error:
+            # The index still learns the name for this process
+            pass
+        with self._lock:
+            if self._aliases is None:
+                self._aliases = self._load()
+            for alias in aliases:
+                self._aliases[alias] = security
+            self.learned += 1
+        return security
+
+    def reload(self):
+        """Drop the in-memory index, the tables are read again on the next lookup."""
+        with self._lock:
+            self._aliases = None
+
+    def stats(self) -> dict:
+        """Return the size of the index and the hit, fuzzy hit and miss counters."""
+        with self._lock:
+            lookups = self.hits + self.fuzzy_hits + self.misses
+            return {
+                "aliases": len(self._aliases or {}),
+                "hits": self.hits,
+                "fuzzy_hits": self.fuzzy_hits,
+                "misses": self.misses,
+                "learned": self.learned,
+                "hit_rate": (self.hits + self.fuzzy_hits) / lookups if lookups else 0.0,
+            }
+
+securities_master = SecuritiesMaster()
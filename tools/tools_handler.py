@@ -35,6 +35,20 @@ def create_tool_node_with_fallback(tools: list) -> dict:
         [RunnableLambda(handle_tool_error)], exception_key = "error"
     )
 
+def async_implementation(sync_tool):
+    """
+    Register a coroutine as the async implementation of a tool, used by tool.ainvoke() on the async graph path
+    instead of running the sync function in a worker thread.
+    Parameters:
+        sync_tool: the tool created with @tool, the coroutine takes the same arguments
+    Returns:
+        decorator of the coroutine
+    """
+    def decorator(coroutine):
+        sync_tool.coroutine = coroutine
+        return coroutine
+    return decorator
+
 def _print_event(event: dict, _printed: set, max_length=1500):
     """
     print even info, especially for dialog state and message info. If the message is too long, it will be cut for readability.
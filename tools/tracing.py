@@ -0,0 +1,357 @@
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Iterator
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.config import var_child_runnable_config
+from tools import TRACING, TRACE_SINKS, TRACE_HISTOGRAM_SIZE
+
+@dataclass
+class Span:
+    """A timed operation: a graph node, a tool, an LLM call, a database query, an embedding or a market data fetch."""
+    kind: str  # 'node', 'tool', 'llm', 'db', 'embedding', 'market_data'
+    name: str  # node, tool, model or operation name
+    span_id: str
+    parent_id: str | None = None
+    start: float = field(default_factory=time.time)  # epoch seconds
+    duration: float | None = None  # seconds, set when the span ends
+    attributes: dict = field(default_factory=dict)  # thread_id, node, tokens, ...
+    error: str | None = None
+
+class SpanSink:
+    """
+    Receives the spans of the tracer, e.g. to aggregate or export them.
+    """
+    def on_start(self, span: Span):
+        """Called when a span starts."""
+
+    def on_end(self, span: Span):
+        """Called when a span ends, with its duration."""
+
+class HistogramSink(SpanSink):
+    """
+    In-memory latency histograms per kind and name, over the latest max_samples spans of each,
+    so memory stays bounded over a long deployment.
+    """
+    def __init__(self, max_samples: int = TRACE_HISTOGRAM_SIZE):
+        """
+        :param max_samples: durations kept per kind and name
+        """
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._counts = defaultdict(int)
+        self._errors = defaultdict(int)
+        self._tokens = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def on_end(self, span: Span):
+        key = (span.kind, span.name)
+        with self._lock:
+            self._samples[key].append(span.duration)
+            self._counts[key] += 1
+            self._errors[key] += span.error is not None
+            self._tokens[key] += span.attributes.get("total_tokens", 0)
+
+    def summary(self, kind: str | None = None) -> dict:
+        """
+        Latency percentiles per kind and name.
+        :param kind: only this kind of span, e.g. 'node', all kinds if None
+        :return: {"kind:name": {"count", "errors", "p50", "p95", "p99", "max", "tokens"}}, durations in milliseconds
+        """
+        with self._lock:
+            items = [(key, np.array(samples) * 1000) for key, samples in self._samples.items()
+                     if kind is None or key[0] == kind]
+            counts, errors, tokens = dict(self._counts), dict(self._errors), dict(self._tokens)
+        result = {}
+        for key, ms in sorted(items):
+            p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+            result[f"{key[0]}:{key[1]}"] = {
+                "count": counts[key], "errors": errors[key], "p50": round(float(p50), 2), "p95": round(float(p95), 2),
+                "p99": round(float(p99), 2), "max": round(float(ms.max()), 2), "tokens": tokens[key],
+            }
+        return result
+
+    def reset(self):
+        """Drop all samples."""
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._errors.clear()
+            self._tokens.clear()
+
+class OpenTelemetrySink(SpanSink):
+    """
+    Mirrors the spans as OpenTelemetry spans, with their parents, so they reach whatever exporter the
+    OpenTelemetry SDK of the process is configured with (OTLP, console, ...).
+    Needs the optional opentelemetry-api package; without an SDK configured the spans are no-ops.
+    """
+    def __init__(self, service_name: str = "digital-banking-assistant"):
+        from opentelemetry import trace
+        self._trace = trace
+        self._tracer = trace.get_tracer(service_name)
+        self._open = {}  # span id -> OpenTelemetry span
+        self._lock = threading.Lock()
+
+    def on_start(self, span: Span):
+        with self._lock:
+            parent = self._open.get(span.parent_id)
+        context = self._trace.set_span_in_context(parent) if parent is not None else None
+        otel_span = self._tracer.start_span(f"{span.kind} {span.name}", context=context,
+                                            start_time=int(span.start * 1e9))
+        with self._lock:
+            self._open[span.span_id] = otel_span
+
+    def on_end(self, span: Span):
+        with self._lock:
+            otel_span = self._open.pop(span.span_id, None)
+        if otel_span is None:
+            return
+        otel_span.set_attribute("span.kind", span.kind)
+        for key, value in span.attributes.items():
+            if isinstance(value, (str, bool, int, float)):
+                otel_span.set_attribute(key, value)
+        if span.error is not None:
+            otel_span.set_status(self._trace.Status(self._trace.StatusCode.ERROR, span.error))
+        otel_span.end(end_time=int((span.start + span.duration) * 1e9))
+
+# Sinks selectable by TRACE_SINKS
+SINKS = {
+    "histogram": HistogramSink,
+    "otel": OpenTelemetrySink,
+}
+
+# Span of the code running in the current context, parent of the spans it opens
+_current_span = ContextVar("current_span", default=None)
+
+class Tracer:
+    """
+    Creates spans and hands them to the sinks.
+    Graph nodes, tools and LLM calls are traced by the LangChain callbacks of TracingCallbackHandler,
+    database queries, embeddings and market data fetches by span() around the code.
+    """
+    def __init__(self, sinks: list[SpanSink] = None, enabled: bool = True):
+        """
+        :param sinks: receivers of the spans
+        :param enabled: False makes span() a no-op and the callback handler is not attached
+        """
+        self.sinks = list(sinks or [])
+        self.enabled = enabled
+        self._open = {}  # span id -> span, to inherit the thread id of the parent
+        self._links = {}  # id of an untraced run (graph, prompt | llm chain) -> id of its parent
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink: SpanSink):
+        """Send the next spans to another sink too."""
+        self.sinks.append(sink)
+
+    @property
+    def histograms(self) -> HistogramSink | None:
+        """The first histogram sink, if any."""
+        return next((sink for sink in self.sinks if isinstance(sink, HistogramSink)), None)
+
+    def start(self, kind: str, name: str, span_id: str = None, parent_id: str = None, **attributes) -> Span:
+        """
+        Start a span
+        :param kind: kind of operation
+        :param name: name of the operation
+        :param span_id: id of the span, a new one if None
+        :param parent_id: id of the parent span, None for a root span
+        :param attributes: attributes of the span, the thread id is inherited from the parent if missing
+        :return: the span, to pass to end()
+        """
+        with self._lock:
+            # skip the untraced runs between the span and its closest traced ancestor
+            while parent_id is not None and parent_id not in self._open and parent_id in self._links:
+                parent_id = self._links[parent_id]
+            parent = self._open.get(parent_id)
+            if parent is not None and "thread_id" not in attributes and "thread_id" in parent.attributes:
+                attributes["thread_id"] = parent.attributes["thread_id"]
+            span = Span(kind=kind, name=name, span_id=span_id or uuid.uuid4().hex, parent_id=parent_id,
+                        attributes=attributes)
+            self._open[span.span_id] = span
+        for sink in self.sinks:
+            sink.on_start(span)
+        return span
+
+    def end(self, span: Span, error: BaseException = None, **attributes):
+        """
+        End a span and hand it to the sinks
+        :param span: the span returned by start()
+        :param error: the exception that ended the operation, if any
+        :param attributes: attributes known at the end, e.g. token counts
+        """
+        span.duration = time.time() - span.start
+        span.attributes.update(attributes)
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._open.pop(span.span_id, None)
+        for sink in self.sinks:
+            sink.on_end(span)
+
+    def link(self, run_id: str, parent_id: str | None):
+        """Record an untraced run, so the spans started inside it get its closest traced ancestor as parent."""
+        with self._lock:
+            self._links[run_id] = parent_id
+
+    def unlink(self, run_id: str):
+        """Forget an untraced run once it ended."""
+        with self._lock:
+            self._links.pop(run_id, None)
+
+    def get(self, span_id: str) -> Span | None:
+        """The open span with this id."""
+        with self._lock:
+            return self._open.get(span_id)
+
+    @contextmanager
+    def _span(self, kind: str, name: str, **attributes) -> Iterator[Span]:
+        span = self.start(kind, name, parent_id=_parent_id(), **attributes)
+        token = _current_span.set(span.span_id)
+        try:
+            yield span
+        except BaseException as e:
+            _current_span.reset(token)
+            self.end(span, error=e)
+            raise
+        _current_span.reset(token)
+        self.end(span)
+
+    def span(self, kind: str, name: str, **attributes):
+        """
+        Trace the with-block as a span, child of the span or LangChain run (node, tool) it runs in.
+        :param kind: kind of operation, e.g. 'db'
+        :param name: name of the operation, e.g. 'read'
+        :param attributes: attributes of the span, more can be set on span.attributes in the block
+        :return: context manager yielding the span, or None when tracing is disabled
+        """
+        if not self.enabled:
+            return nullcontext()
+        return self._span(kind, name, **attributes)
+
+def _parent_id() -> str | None:
+    # the enclosing span(), or else the LangChain run (tool, node) the code is running in
+    current = _current_span.get()
+    if current is not None:
+        return current
+    config = var_child_runnable_config.get()
+    parent_run_id = getattr((config or {}).get("callbacks"), "parent_run_id", None)
+    return parent_run_id.hex if parent_run_id else None
+
+def _token_usage(response) -> dict:
+    # token counts of an LLM response, from the usage metadata of the message or the provider's llm_output
+    try:
+        usage = response.generations[0][0].message.usage_metadata
+    except (AttributeError, IndexError):
+        usage = None
+    if usage:
+        return {"input_tokens": usage.get("input_tokens", 0), "output_tokens": usage.get("output_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0)}
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return {"input_tokens": usage.get("prompt_tokens", 0), "output_tokens": usage.get("completion_tokens", 0),
+                "total_tokens": usage.get("total_tokens", 0)}
+    return {}
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    LangChain callbacks turning graph nodes, tool invocations and LLM calls into spans,
+    attached to the graph config so every run of a conversation is traced with its thread id.
+    """
+    run_inline = True  # record the start time on the event loop instead of in a worker thread
+
+    def __init__(self, tracer: "Tracer"):
+        self.tracer = tracer
+
+    def _start(self, kind: str, name: str, run_id, parent_run_id, metadata: dict | None, **attributes):
+        metadata = metadata or {}
+        if "thread_id" in metadata:
+            attributes["thread_id"] = metadata["thread_id"]
+        if "langgraph_node" in metadata:
+            attributes["node"] = metadata["langgraph_node"]
+        self.tracer.start(kind, name, span_id=run_id.hex, parent_id=parent_run_id.hex if parent_run_id else None,
+                          **attributes)
+
+    def _end(self, run_id, error: BaseException = None, **attributes):
+        span = self.tracer.get(run_id.hex)
+        if span is not None:
+            self.tracer.end(span, error=error, **attributes)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        # only the runs of the graph nodes themselves, not every runnable inside them
+        if metadata and kwargs.get("name") == metadata.get("langgraph_node"):
+            self._start("node", kwargs["name"], run_id, parent_run_id, metadata)
+        else:
+            self.tracer.link(run_id.hex, parent_run_id.hex if parent_run_id else None)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self.tracer.unlink(run_id.hex)
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        # an interrupt before a sensitive tool also ends the node run with an exception
+        self.tracer.unlink(run_id.hex)
+        self._end(run_id, error=error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        self._start("tool", (serialized or {}).get("name") or kwargs.get("name", "tool"), run_id, parent_run_id,
+                    metadata)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, tags=None, metadata=None,
+                            **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+        self._start("llm", model, run_id, parent_run_id, metadata)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        model = (metadata or {}).get("ls_model_name") or (serialized or {}).get("name", "llm")
+        self._start("llm", model, run_id, parent_run_id, metadata)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id, **_token_usage(response))
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=error)
+
+def create_tracer(sinks: str = TRACE_SINKS, enabled: bool = TRACING) -> Tracer:
+    """
+    Create a tracer.
+    :param sinks: comma-separated sink names, 'histogram' and/or 'otel'
+    :param enabled: whether to trace
+    :return: the tracer
+    """
+    names = [name.strip() for name in sinks.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SINKS]
+    if unknown:
+        raise ValueError(f"Unknown trace sinks {unknown}, use some of {list(SINKS)}")
+    return Tracer([SINKS[name]() for name in names], enabled=enabled)
+
+tracer = create_tracer()
+tracing_callback = TracingCallbackHandler(tracer)
+
+def trace_summary(kind: str | None = None) -> dict:
+    """
+    p50/p95/p99 latency in milliseconds per kind and name of span, e.g. trace_summary('node') per graph node.
+    :param kind: only this kind of span, all kinds if None
+    :return: the summary of the histogram sink, empty without one
+    """
+    histograms = tracer.histograms
+    return histograms.summary(kind) if histograms is not None else {}
+
+def format_trace_summary(kind: str | None = None) -> str:
+    """Render trace_summary() as a table."""
+    lines = [f"{'span':<45} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'tokens':>8}"]
+    for name, stats in trace_summary(kind).items():
+        lines.append(f"{name:<45} {stats['count']:>6} {stats['p50']:>9.1f} {stats['p95']:>9.1f} "
+                     f"{stats['p99']:>9.1f} {stats['tokens']:>8}")
+    return "\n".join(lines)
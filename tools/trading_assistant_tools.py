@@ -1,67 +1,163 @@
+import asyncio
+import math
+import time
 from datetime import datetime
-from sqlite3 import connect
-from typing import Literal, Optional
-import pandas as pd
-from langchain_core.prompts import PromptTemplate
+from typing import Literal
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 from langchain_core.tools import tool
-from langchain_tavily import TavilySearch
-from pydantic import BaseModel, Field
-from graph.llm import llm
-from tools import TAVILY_API_KEY, banking_data_db
+from tools import QUOTE_FETCH_WORKERS, QUOTE_FETCH_TIMEOUT
+from tools.db_connection import read_connection, write_connection
+from tools.market_data import stock_name_price, get_market_data_provider
+from tools.quote_cache import quote_cache
+from tools.securities import securities_master
+from tools.tools_handler import async_implementation
+from tools.tracing import tracer
+from tools.resources import lazy_module
+
+# pandas is imported on the first query that needs it, not at startup
+pd = lazy_module("pandas")
+
+# Open holdings of one account, with cost basis and realized P&L
+positions_query = """
+    SELECT stock, shares, cost_basis, realized_earning FROM positions
+    WHERE account_id = ? AND shares > 0 ORDER BY stock
+"""
+# User's trading account and its latest cash balance, a primary-key lookup in the balance snapshot
+trading_balance_query = """
+    SELECT u.trading_account, b.balance
+    FROM user u LEFT JOIN account_balances b ON b.account_id = u.trading_account
+    WHERE u.user_id = ?
+"""
 
-# data class for structured output
-class stock_name_price(BaseModel):
-    """
-    Return the stock name and its current price.
-    """
-    stock_name : Optional[str] = Field(description = "the company name of the stock, not the ticker, not with '.com' or any appendix. English name only.")
-    stock_price: Optional[float] = Field(description="the current price of the stock")
 # Get current stock price, US stock market only
 def get_current_price(stock: str):
     """
     Get the current stock price.
     This is not a tool. This is a function that will be used in the tool of check_earnings and trad_stock.
+    Quotes are served from the process-wide quote cache while they are fresh, a listed stock without a price is not cached.
     Args:
         stock: the stock/security/share name
 
     Returns:
         the stock name and current stock price in a class of stock_price
     """
-    # Check if the stock is listed in US stock market
-    search = TavilySearch(max_results=1, api_key=TAVILY_API_KEY)
-    query_listed = f"The stock market where {stock} is traded"
-    response_listed = search.run(query_listed)
-
-    result_listed = llm.invoke(
-        f"This describes the listed market of a stock: {response_listed['results'][0]['content']}."
-        "If you think it is not listed in the US stock market, return the string of 'No'."
-        "Otherwise, return the string of 'Yes'."
-        "Only make judgement based on provided information, don't assume anything."
-        "Only return the result in string of 'Yes' or 'No'."
-    )
+    cached = quote_cache.get(stock)
+    if cached is None:
+        start = time.perf_counter()
+        with tracer.span("market_data", "get_price", stock=stock):
+            quote = _fetch_current_price(stock)
+        if quote.stock_name is not None and quote.stock_price is None:
+            # A failed price extraction is not cached, the next call fetches the price again
+            return quote
+        cached = quote_cache.put(stock, quote.stock_name, quote.stock_price, time.perf_counter() - start)
+    return stock_name_price(stock_name=cached.stock_name, stock_price=cached.stock_price)
+
+def get_current_prices(stocks: list[str]) -> dict:
+    """
+    Get the current prices of several stocks concurrently.
+    This is not a tool. The quotes are fetched through a bounded thread pool, each one within QUOTE_FETCH_TIMEOUT seconds,
+    so the latency follows the slowest single quote instead of the sum of all quotes.
+    Args:
+        stocks: the stock/security/share names
 
-    # Formulate the output class
-    # Use the stock name from the search result for standardization
-    if result_listed.content == 'No':
-        no_listed_result = stock_name_price(stock_name = None, stock_price = None)
-        return no_listed_result
-    else:
-        query_price = f"Check the current share price of {stock} in the US stock market."
-        response_price = search.run(query_price)
-        if response_price["results"][0]["content"]:
-            prompt_template = PromptTemplate.from_template(
-                'Here is the latest information of a stock price: {info}, '
-                'please extract the company English name as the stock name in string and the the stock price in float.'
-                'For the stock name, use the English company name, not the ticker, not with "Inc", ".com", "Corporation" or any appendix. Return English name only.'
-                'For example, use "Adobe", never use "Adobe Inc.", "Adobe.com" or "Adobe Corporation".'
-                'For the stock price, if there are multiple numbers mentioned, use the one with highest probability as the stoke price. Return one float only.'
-            )
-            runnable = llm.with_structured_output(stock_name_price)
-            chain = prompt_template | runnable
-            final_response = chain.invoke({'info':response_price["results"][0]["content"]})
-        return final_response
+    Returns:
+        a dictionary of stock name to stock_name_price, None for the quotes that failed or timed out
+    """
+    quotes = {}
+    if not stocks:
+        return quotes
+    workers = min(len(stocks), QUOTE_FETCH_WORKERS)
+    executor = ContextThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = {stock: executor.submit(get_current_price, stock) for stock in stocks}
+        # Every round of the pool gets the per-quote timeout
+        deadline = time.monotonic() + QUOTE_FETCH_TIMEOUT * math.ceil(len(stocks) / workers)
+        for stock, future in futures.items():
+            try:
+                quotes[stock] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception:
+                # A late quote still lands in the quote cache for the next call
+                quotes[stock] = None
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return quotes
+
+def _fetch_current_price(stock: str):
+    """
+    Fetch the current stock price from the configured market data provider, bypassing the quote cache.
+    Known securities are resolved by the securities master, so only the price is fetched.
+    Unknown names go through the listing check and name extraction of the provider, the listed ones are written back to the master.
+    Args:
+        stock: the stock/security/share name
+
+    Returns:
+        the stock name and current stock price in a class of stock_price
+    """
+    provider = get_market_data_provider()
+    security = securities_master.resolve(stock)
+    if security is None:
+        quote = provider.get_quote(stock)
+        securities_master.learn(stock, quote)
+        return quote
+    if not security.listed_us:
+        return stock_name_price(stock_name=None, stock_price=None)
+    quote = provider.get_price(security.stock_name)
+    return stock_name_price(stock_name=security.stock_name, stock_price=quote.stock_price)
+
+async def aget_current_price(stock: str):
+    """
+    Async version of get_current_price(), the quote is awaited on the event loop.
+    Args:
+        stock: the stock/security/share name
+
+    Returns:
+        the stock name and current stock price in a class of stock_price
+    """
+    cached = quote_cache.get(stock)
+    if cached is None:
+        start = time.perf_counter()
+        with tracer.span("market_data", "get_price", stock=stock):
+            quote = await _afetch_current_price(stock)
+        if quote.stock_name is not None and quote.stock_price is None:
+            # A failed price extraction is not cached, the next call fetches the price again
+            return quote
+        cached = quote_cache.put(stock, quote.stock_name, quote.stock_price, time.perf_counter() - start)
+    return stock_name_price(stock_name=cached.stock_name, stock_price=cached.stock_price)
+
+async def aget_current_prices(stocks: list[str]) -> dict:
+    """
+    Async version of get_current_prices(), at most QUOTE_FETCH_WORKERS quotes in flight, each within QUOTE_FETCH_TIMEOUT seconds.
+    Args:
+        stocks: the stock/security/share names
 
-# TODO: Tool with Tavily search to get finance information
+    Returns:
+        a dictionary of stock name to stock_name_price, None for the quotes that failed or timed out
+    """
+    semaphore = asyncio.Semaphore(QUOTE_FETCH_WORKERS)
+
+    async def fetch(stock):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(aget_current_price(stock), QUOTE_FETCH_TIMEOUT)
+            except Exception:
+                return None
+
+    return dict(zip(stocks, await asyncio.gather(*(fetch(stock) for stock in stocks))))
+
+async def _afetch_current_price(stock: str):
+    """Async version of _fetch_current_price(), the database write back runs in a worker thread."""
+    provider = get_market_data_provider()
+    security = securities_master.resolve(stock)
+    if security is None:
+        quote = await provider.aget_quote(stock)
+        await asyncio.to_thread(securities_master.learn, stock, quote)
+        return quote
+    if not security.listed_us:
+        return stock_name_price(stock_name=None, stock_price=None)
+    quote = await provider.aget_price(security.stock_name)
+    return stock_name_price(stock_name=security.stock_name, stock_price=quote.stock_price)
+
+# TODO: Tool with market data search (Tavily by default) to get finance information
 @tool
 def search_stock(stock: str):
     """
@@ -72,18 +168,11 @@ def search_stock(stock: str):
     Returns:
         The summary of the stock price and the relevant analysis of the price and the company.
     """
-    query = f"Check the current stock price of {stock} and the most recent analysis articles on the stock price movement or the company news that affects the stock price."
-    search = TavilySearch(max_results=3, api_key=TAVILY_API_KEY)
-    response = search.run(query)
-    if response["results"]:
-        prompt_input = "\n\n".join([d["content"] for d in response["results"]])
-
-    final_response = llm.invoke(
-        f"Here is the latest information of {stock} stock price: {prompt_input}, "
-        f"please summarize them in following format: The stock price of {stock} is XXX, and the analysis of the stock is XXXX."
-    )
+    return get_market_data_provider().search_stock(stock)
 
-    return final_response.content
+@async_implementation(search_stock)
+async def asearch_stock(stock: str):
+    return await get_market_data_provider().asearch_stock(stock)
 
 # TODO: Tool to check the balance of the user's trading account
 @tool
@@ -96,27 +185,17 @@ def check_trading_account_balance(user_id: str):
     Returns:
         the balance of saving account from this user id
     """
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(trading_balance_query, (user_id,))
+        row = cursor.fetchone()
         cursor.close()
-        conn.close()
+    if row is None:
         return "No user found with this ID."
-    trading_account = row[0]
+    trading_account, current_cash = row
     if trading_account is None:
-        cursor.close()
-        conn.close()
         return "The client has no trading account with the bank."
-
-    df_all = pd.read_sql_query(f"SELECT * FROM {trading_account}", conn).sort_values("date").reset_index(drop=True)
-    if len(df_all)>0:
-        current_cash = df_all["cash_end"].iloc[-1]
-    else:
-        current_cash = 0
-    cursor.close()
-    conn.close()
+    current_cash = current_cash or 0
     return f"The user's trading account balance is ${current_cash:,.2f}."
 
 # TODO: Tool to check the earnings and holding details of the user's trading account
@@ -131,76 +210,58 @@ def check_earnings(user_id: str):
     Returns:
         a summary that describes what and how many stocks (equities, shares) the user is holding and what are their market values. What is the current profit or loss of the user.
     """
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        cursor.close()
-        conn.close()
-        return "No user found with this ID."
-    trading_account = row[0]
-    if trading_account is None:
+    positions = _load_positions(user_id)
+    if isinstance(positions, str):
+        return positions
+    # Fetch the current prices of all holdings concurrently
+    quotes = get_current_prices([stock for stock, _, _, _ in positions])
+    return _earnings_summary(positions, quotes)
+
+@async_implementation(check_earnings)
+async def acheck_earnings(user_id: str):
+    positions = await asyncio.to_thread(_load_positions, user_id)
+    if isinstance(positions, str):
+        return positions
+    quotes = await aget_current_prices([stock for stock, _, _, _ in positions])
+    return _earnings_summary(positions, quotes)
+
+def _load_positions(user_id: str):
+    """Open positions of the user's trading account, or the message to return if there is none."""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
         cursor.close()
-        conn.close()
-        return "The client has no trading account with the bank."
+        if row is None:
+            return "No user found with this ID."
+        trading_account = row[0]
+        if trading_account is None:
+            return "The client has no trading account with the bank."
 
-    # Calculate the performance
-    df_all = pd.read_sql_query(f"SELECT * FROM {trading_account}", conn).sort_values("date").reset_index(drop=True) # Sort trades by date (safety)
-    cursor.close()
-    conn.close()
-
-    # Dictionary to track each stock's holdings and P&L
-    holdings = {}
-    for _, row in df_all.iterrows():
-        stock = row["stock"]
-        volume = row["volume"]  # + for buy, - for sell
-        total_amount = row["total_amount"]  # includes trading fee
-        unit_cost = row["total_amount"] / row["volume"]
-
-        if stock not in holdings:
-            holdings[stock] = {"shares": 0, "cost_basis": 0.0, "realized_earning": 0.0}
-
-        h = holdings[stock]
-
-        if volume > 0:  # Buy
-            h["shares"] += volume
-            h["cost_basis"] += total_amount
-
-        else:  # Sell
-            shares_to_sell = -volume
-            avg_cost = h["cost_basis"] / h["shares"] if h["shares"] > 0 else 0
-            # Realized P&L from this sale
-            realized = (unit_cost - avg_cost) * shares_to_sell
-            h["realized_earning"] += realized
-            # Reduce shares and cost basis
-            h["shares"] += volume  # volume is negative
-            h["cost_basis"] -= avg_cost * shares_to_sell
-
-            # Safety check: reset if no shares remain
-            if h["shares"] == 0:
-                h["cost_basis"] = 0.0
+        # Holdings and P&L come from the positions snapshot, rebuilt from the trade ledger at bootstrap
+        return conn.execute(positions_query, (trading_account,)).fetchall()
 
+def _earnings_summary(positions: list, quotes: dict) -> str:
+    """Summarize holdings, values and earnings of the positions at the quoted prices."""
     # Build result dict (only stocks with remaining shares)
     results = []
-    for stock, h in holdings.items():
-        if h["shares"] > 0:
-            avg_price = h["cost_basis"] / h["shares"]
-            # get the current stock price
-            current_price = get_current_price(stock).stock_price
-            results.append({
-                "stock": stock,
-                "shares_remaining": h["shares"],
-                "holding_price": round(avg_price, 2),
-                "realized_earning": round(h["realized_earning"], 2),
-                "current_price": current_price,
-                "holding_value":h["shares"]*current_price,
-                "holding_earning":(current_price*h["shares"]) - h["cost_basis"],
-                "unrealized_earning": round((current_price - avg_price) * h["shares"], 2) if current_price is not None else None
-            })
+    for stock, shares, cost_basis, realized_earning in positions:
+        avg_price = cost_basis / shares
+        current_price = quotes[stock].stock_price if quotes.get(stock) is not None else None
+        results.append({
+            "stock": stock,
+            "shares_remaining": shares,
+            "holding_price": round(avg_price, 2),
+            "realized_earning": round(realized_earning, 2),
+            "current_price": current_price,
+            "holding_value":shares*current_price if current_price is not None else None,
+            "holding_earning":(current_price*shares) - cost_basis if current_price is not None else None,
+            "unrealized_earning": round((current_price - avg_price) * shares, 2) if current_price is not None else None
+        })
 
     # Create a natural language summary
     parts = []
+    unpriced = []
     total_value = 0
     total_holding_earning = 0
     total_realized_earning = 0
@@ -214,9 +275,20 @@ def check_earnings(user_id: str):
         holding_earning = item['holding_earning']
         holding_value = item['holding_value']
 
+        total_realized_earning += realized
+
+        # Partial result when the quote of this stock failed or timed out
+        if current_price is None:
+            unpriced.append(stock)
+            parts.append(
+                f"stock {stock} with {shares} shares at ${holding_price:.2f} per share, "
+                f"the current price of the stock is currently unavailable, "
+                f"and the realized earning is ${realized:,.2f}."
+            )
+            continue
+
         total_value += holding_value
         total_holding_earning += holding_earning
-        total_realized_earning += realized
 
         parts.append(
             f"stock {stock} with {shares} shares at ${holding_price:.2f} per share, "
@@ -230,6 +302,11 @@ def check_earnings(user_id: str):
         f"\n\nIn total, the user's total holding value of all stocks is "
         f"${total_value:,.2f}, the total holding earning is ${total_holding_earning:,.2f}, and the total realized earning is ${total_realized_earning:,.2f}."
     )
+    if unpriced:
+        summary += (
+            f"\nThe current price of {', '.join(unpriced)} could not be retrieved, "
+            f"so the holding value and holding earning of these stocks are not included in the totals."
+        )
     return summary
 
 # TODO: Tool to check pending orders
@@ -244,26 +321,21 @@ def check_pending_order(user_id: str):
         Information about user's pending orders.
     """
     # Have the user's trading account first.
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        cursor.close()
-        conn.close()
-        return "No user found with this ID."
-    trading_account = row[0]
-    if trading_account is None:
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
+        row = cursor.fetchone()
         cursor.close()
-        conn.close()
-        return "The user has no trading account with the bank."
-
-    # Have the pending orders
-    query = "SELECT * FROM pending_orders WHERE trading_account = ?"
-    df_orders = pd.read_sql_query(query, conn, params=(trading_account,)).reset_index(drop=True)
+        if row is None:
+            return "No user found with this ID."
+        trading_account = row[0]
+        if trading_account is None:
+            return "The user has no trading account with the bank."
+
+        # Have the pending orders
+        query = "SELECT * FROM pending_orders WHERE trading_account = ?"
+        df_orders = pd.read_sql_query(query, conn, params=(trading_account,)).reset_index(drop=True)
     dict_orders = df_orders.to_dict(orient="records")
-    cursor.close()
-    conn.close()
 
     if len(dict_orders) == 0:
         return "The user has no pending orders."
@@ -301,135 +373,122 @@ def trade_stock(user_id: str, stock: str, action: Literal["buy", "sell"], volume
     Returns:
         The status of the trade, and an update to the database if the trade is successfully submitted.
     """
-    current_price = get_current_price(stock)
+    return _submit_order(user_id, get_current_price(stock), action, volume, price)
+
+@async_implementation(trade_stock)
+async def atrade_stock(user_id: str, stock: str, action: Literal["buy", "sell"], volume: int, price: float):
+    current_price = await aget_current_price(stock)
+    return await asyncio.to_thread(_submit_order, user_id, current_price, action, volume, price)
+
+def _submit_order(user_id: str, current_price: stock_name_price, action: str, volume: int, price: float) -> str:
+    """Validate a day limit order against the current price, the cash and the holdings, and insert it into pending_orders."""
     if current_price.stock_name is None:
         return f"The stock you want to {action} is not available in the US stock market. We only support tradeing in the US stock market."
+    elif current_price.stock_price is None:
+        return f"The current price of {current_price.stock_name} is not available at the moment. Please try again later."
     else:
         stock = current_price.stock_name
     # Get user trading account information
-    conn = connect(banking_data_db)
-    cursor = conn.cursor()
-    cursor.execute("SELECT trading_account FROM user WHERE user_id = ?", (user_id,))
-    row = cursor.fetchone()
-    if row is None:
-        cursor.close()
-        conn.close()
-        return "No user found with this ID."
-    trading_account = row[0]
-    if trading_account is None:
-        cursor.close()
-        conn.close()
-        return "The user has no trading account with the bank."
-
-    # Trading information for both buy and sell orders
-    # Trading history and trading account balance
-    df_all = pd.read_sql_query(f"SELECT * FROM {trading_account}", conn).sort_values("date").reset_index(drop=True)
-    # Pending orders
-    query = "SELECT * FROM pending_orders WHERE trading_account = ?"
-    df_orders = pd.read_sql_query(query, conn, params=(trading_account,)).reset_index(drop=True)
-    # Trading amount
-    trading_amount = price * volume
-    trading_fee = trading_amount * 0.005
-    # Current date and time
-    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-    # Trade logic
-    # Buy orders
-    if action == "buy":
-        # Get available funds for validation of buy orders
-        # Get latest cash_end
-        if len(df_all) > 0:
-            current_cash = df_all["cash_end"].iloc[-1]
-        else:
-            current_cash = 0
-        # Get the pending buy order amount
-        df_buy_orders = df_orders[df_orders["action"] == "buy"]
-        dict_buy_orders = df_buy_orders.to_dict(orient="records")
-        if len(dict_buy_orders) > 0:
-            pending_buy_order_amount = sum(item["total_amount"] for item in dict_buy_orders)
-        else:
-            pending_buy_order_amount = 0
-
-        # Get total amount and available fund for the buy order
-        total_amount = trading_amount + trading_fee
-        available_funds = current_cash - pending_buy_order_amount
-
-        if price < current_price.stock_price * 0.8:
-            cursor.close()
-            conn.close()
-            return f"Your bid price falls below the permitted threshold of ${current_price.stock_price * 0.8:,.2f}. Kindly revise your buy order to comply with the requirements."
-        elif total_amount > current_cash:
-            cursor.close()
-            conn.close()
-            return (
-                f"Insufficient funds: Your trading account does not currently hold sufficient funds to place this buy order.\n"
-                f"Required amount (including applicable trading fees): ${total_amount:,.2f}.\n"
-                f"Available funds for trading: ${available_funds:,.2f}.\n"
-                "Please ensure your account is adequately funded before submitting a new order."
-            )
-        else:
-            cursor.execute(
-                """
-                INSERT INTO pending_orders (date, trading_account, stock, action, unit_price, volume, trading_amount, trading_fee, total_amount)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (now, trading_account, current_price.stock_name, "buy", price, volume, trading_amount, trading_fee,
-                 total_amount)
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return (
-                f"Order Confirmation: Your request to purchase {volume} shares of {current_price.stock_name} at ${price:,.2f} per share has been successfully submitted.\n"
-                f"Total amount reserved for settlement: ${total_amount:,.2f}, which includes a trading fee of ${trading_fee:,.2f}."
-            )
-
-    # Sell orders
-    elif action == "sell":
-        # Get available shares for validation of sell orders
-        # Track holdings
-        df_stock = df_all[df_all["stock"] == stock]
-        if len(df_stock) > 0:
-            current_holdings = df_stock["volume"].sum()
-        else:
-            current_holdings = 0
-        # Get pending volume for sell orders
-        df_sell_orders = df_orders[df_orders["action"] == "sell"]
-        df_stock_sell_orders = df_sell_orders[df_sell_orders["stock"] == stock]
-        if len(df_stock_sell_orders) > 0:
-            pending_sell_order_volume = abs(df_stock_sell_orders["volume"].sum())
-        else:
-            pending_sell_order_volume = 0
-        # Get total amount and available volume for the sell order
-        total_amount = trading_amount - trading_fee
-        available_volume = current_holdings - pending_sell_order_volume
-
-        if available_volume < volume:
-            cursor.close()
-            conn.close()
-            return (
-                f"You do not currently hold a sufficient quantity of {current_price.stock_name} shares to place this sell order.\n"
-                f"Available volume for trading: {int(available_volume)}.\n"
-            )
-        elif price > current_price.stock_price * 1.2:
-            cursor.close()
-            conn.close()
-            return f"Your asking price exceeds the allowable limit of ${current_price.stock_price * 1.2:,.2f}. Please adjust your sell order to align with the requirements."
-        else:
-            cursor.execute(
-                """
-                INSERT INTO pending_orders (date, trading_account, stock, action, unit_price, volume, trading_amount, trading_fee, total_amount)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (now, trading_account, current_price.stock_name, "sell", price, int(volume * (-1)),
-                 trading_amount * (-1), trading_fee, total_amount * (-1))
-            )
-            conn.commit()
-            cursor.close()
-            conn.close()
-            return (
-                f"Order Confirmation: Your request to sell {volume} shares of {current_price.stock_name} at ${price:,.2f} per share has been successfully submitted.\n"
-                f"Estimated net proceeds from this transaction: ${total_amount:,.2f}, after deducting a trading fee of ${trading_fee:,.2f}."
-            )
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(trading_balance_query, (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return "No user found with this ID."
+        trading_account, current_cash = row
+        if trading_account is None:
+            return "The user has no trading account with the bank."
+
+        # Trading information for both buy and sell orders
+        # Pending orders
+        query = "SELECT * FROM pending_orders WHERE trading_account = ?"
+        df_orders = pd.read_sql_query(query, conn, params=(trading_account,)).reset_index(drop=True)
+        # Trading amount
+        trading_amount = price * volume
+        trading_fee = trading_amount * 0.005
+        # Current date and time
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        # Trade logic
+        # Buy orders
+        if action == "buy":
+            # Get available funds for validation of buy orders
+            # Latest cash_end comes from the balance snapshot
+            current_cash = current_cash or 0
+            # Get the pending buy order amount
+            df_buy_orders = df_orders[df_orders["action"] == "buy"]
+            dict_buy_orders = df_buy_orders.to_dict(orient="records")
+            if len(dict_buy_orders) > 0:
+                pending_buy_order_amount = sum(item["total_amount"] for item in dict_buy_orders)
+            else:
+                pending_buy_order_amount = 0
+
+            # Get total amount and available fund for the buy order
+            total_amount = trading_amount + trading_fee
+            available_funds = current_cash - pending_buy_order_amount
+
+            if price < current_price.stock_price * 0.8:
+                return f"Your bid price falls below the permitted threshold of ${current_price.stock_price * 0.8:,.2f}. Kindly revise your buy order to comply with the requirements."
+            elif total_amount > current_cash:
+                return (
+                    f"Insufficient funds: Your trading account does not currently hold sufficient funds to place this buy order.\n"
+                    f"Required amount (including applicable trading fees): ${total_amount:,.2f}.\n"
+                    f"Available funds for trading: ${available_funds:,.2f}.\n"
+                    "Please ensure your account is adequately funded before submitting a new order."
+                )
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO pending_orders (date, trading_account, stock, action, unit_price, volume, trading_amount, trading_fee, total_amount)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (now, trading_account, current_price.stock_name, "buy", price, volume, trading_amount, trading_fee,
+                     total_amount)
+                )
+                cursor.close()
+                return (
+                    f"Order Confirmation: Your request to purchase {volume} shares of {current_price.stock_name} at ${price:,.2f} per share has been successfully submitted.\n"
+                    f"Total amount reserved for settlement: ${total_amount:,.2f}, which includes a trading fee of ${trading_fee:,.2f}."
+                )
+
+        # Sell orders
+        elif action == "sell":
+            # Get available shares for validation of sell orders
+            # Current holdings come from the positions table
+            cursor.execute("SELECT shares FROM positions WHERE account_id = ? AND stock = ?", (trading_account, stock))
+            position = cursor.fetchone()
+            current_holdings = position[0] if position else 0
+            # Get pending volume for sell orders
+            df_sell_orders = df_orders[df_orders["action"] == "sell"]
+            df_stock_sell_orders = df_sell_orders[df_sell_orders["stock"] == stock]
+            if len(df_stock_sell_orders) > 0:
+                pending_sell_order_volume = abs(df_stock_sell_orders["volume"].sum())
+            else:
+                pending_sell_order_volume = 0
+            # Get total amount and available volume for the sell order
+            total_amount = trading_amount - trading_fee
+            available_volume = current_holdings - pending_sell_order_volume
+
+            if available_volume < volume:
+                return (
+                    f"You do not currently hold a sufficient quantity of {current_price.stock_name} shares to place this sell order.\n"
+                    f"Available volume for trading: {int(available_volume)}.\n"
+                )
+            elif price > current_price.stock_price * 1.2:
+                return f"Your asking price exceeds the allowable limit of ${current_price.stock_price * 1.2:,.2f}. Please adjust your sell order to align with the requirements."
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO pending_orders (date, trading_account, stock, action, unit_price, volume, trading_amount, trading_fee, total_amount)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (now, trading_account, current_price.stock_name, "sell", price, int(volume * (-1)),
+                     trading_amount * (-1), trading_fee, total_amount * (-1))
+                )
+                cursor.close()
+                return (
+                    f"Order Confirmation: Your request to sell {volume} shares of {current_price.stock_name} at ${price:,.2f} per share has been successfully submitted.\n"
+                    f"Estimated net proceeds from this transaction: ${total_amount:,.2f}, after deducting a trading fee of ${trading_fee:,.2f}."
+                )
 
     return "The specified trade action is invalid. Kindly select either 'buy' or 'sell' to proceed with your transaction."
\ No newline at end of file
@@ -0,0 +1,121 @@
+import numpy as np
+
+def prepare_vectors(vectors, dim: int = 0) -> np.ndarray:
+    """
+    Turn embeddings into the layout the indexes search: contiguous float32 rows, L2-normalized,
+    so that a dot product is the cosine similarity.
+    :param vectors: one vector per row, or a single vector
+    :param dim: keep only the first dim dimensions before normalizing, 0 keeps all of them
+    :return: the normalized float32 matrix (a single vector stays 1-d)
+    """
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if dim:
+        matrix = matrix[..., :dim]
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.ascontiguousarray(matrix / np.where(norms > 0, norms, 1.0), dtype=np.float32)
+
+def _top_k(scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Top k of every row of a score matrix, sorted by descending score."""
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(idx, order, axis=1)
+
+class FlatIndex:
+    """
+    Exact search: one matrix product of the queries with all rows.
+    """
+    kind = "flat"
+
+    def __init__(self, matrix: np.ndarray):
+        """
+        :param matrix: normalized float32 rows, see prepare_vectors()
+        """
+        self.matrix = matrix
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k rows most similar to each query.
+        :param queries: normalized float32 queries, one per row
+        :param k: number of results per query
+        :return: scores and row ids, both of shape (queries, k)
+        """
+        if len(self.matrix) == 0:
+            return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+        return _top_k(queries @ self.matrix.T, k)
+
+class IVFIndex:
+    """
+    Approximate search with an inverted file: rows are clustered with spherical k-means,
+    and a query only scans the rows of the n_probe clusters whose centroids are closest to it.
+    """
+    kind = "ivf"
+
+    def __init__(self, matrix: np.ndarray, n_lists: int = 0, n_probe: int = 8, n_iter: int = 10, seed: int = 0):
+        """
+        Build the index
+        :param matrix: normalized float32 rows, see prepare_vectors()
+        :param n_lists: number of clusters, 0 for about sqrt(rows)
+        :param n_probe: number of clusters scanned per query, more gives a better recall and a slower search
+        :param n_iter: k-means iterations
+        :param seed: seed of the initial centroids
+        """
+        self.matrix = matrix
+        n = len(matrix)
+        n_lists = min(n_lists or max(1, int(np.sqrt(n))), max(n, 1))
+        self.n_probe = n_probe
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(n, n_lists, replace=False)].copy() if n else np.zeros((0, matrix.shape[1]), np.float32)
+        assign = np.zeros(n, dtype=np.int64)
+        for _ in range(n_iter):
+            assign = np.argmax(matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, matrix)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # an empty cluster keeps its centroid
+            centroids = np.where(norms > 0, sums / np.where(norms > 0, norms, 1.0), centroids).astype(np.float32)
+        self.centroids = centroids
+        # rows of every cluster, stored contiguously so a probe reads one slice
+        order = np.argsort(assign, kind="stable")
+        self._row_ids = order
+        self._sorted = np.ascontiguousarray(matrix[order])
+        self._offsets = np.r_[0, np.cumsum(np.bincount(assign, minlength=n_lists))]
+
+    def search(self, queries: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Find about the k rows most similar to each query.
+        :param queries: normalized float32 queries, one per row
+        :param k: number of results per query
+        :return: scores and row ids, both of shape (queries, k), padded with -inf / -1 if fewer rows were scanned
+        """
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        if len(self.centroids) == 0:
+            return scores, ids
+        n_probe = min(self.n_probe, len(self.centroids))
+        _, probes = _top_k(queries @ self.centroids.T, n_probe)
+        for i, query in enumerate(queries):
+            slices = [np.arange(self._offsets[c], self._offsets[c + 1]) for c in probes[i]]
+            candidates = np.concatenate(slices)
+            if len(candidates) == 0:
+                continue
+            top_scores, top = _top_k((self._sorted[candidates] @ query)[None, :], k)
+            scores[i, :top.shape[1]] = top_scores[0]
+            ids[i, :top.shape[1]] = self._row_ids[candidates[top[0]]]
+        return scores, ids
+
+def build_index(matrix: np.ndarray, kind: str = "auto", min_rows: int = 5000, n_probe: int = 8):
+    """
+    Build the index for a matrix.
+    :param matrix: normalized float32 rows, see prepare_vectors()
+    :param kind: 'flat', 'ivf', or 'auto' for an IVF index from min_rows rows on
+    :param min_rows: size from which 'auto' builds an IVF index
+    :param n_probe: clusters scanned per query by an IVF index
+    :return: FlatIndex or IVFIndex
+    """
+    if kind == "ivf" or (kind == "auto" and len(matrix) >= min_rows):
+        return IVFIndex(matrix, n_probe=n_probe)
+    if kind in ("flat", "auto"):
+        return FlatIndex(matrix)
+    raise ValueError(f"Unknown vector index '{kind}', use 'flat', 'ivf' or 'auto'")